@@ -1,20 +1,25 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Header
+from fastapi.security import OAuth2PasswordBearer
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 import os
 from dotenv import load_dotenv
 import asyncio
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-import httpx
 import json
-from openai import AsyncOpenAI
+from jobs import IdempotencyConflict, JobQueue, JobWorkerPool, public_job
+from llm import chat_completion, llm_metrics, LLMUnavailableError
+from fallback_verses import find_fallback_verse
+from response_cache import ResponseCache
+from admission import AdmissionController, client_address
+from http_cache import DefaultResponse, StaticJSON, cached_json
+from prompts import ANALYZE, ANALYZE_MAX_TOKENS, VERSE, Analysis, parse_analysis
+from profiling import (LOOP_LAG_MONITOR, LoopLagMonitor, ProfilingMiddleware,
+                       get_request_profile, profile_window, require_admin)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -23,39 +28,75 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Configure OpenAI
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    logger.error("OpenAI API key not found in environment variables")
-    raise ValueError("OpenAI API key not found")
-
-client = AsyncOpenAI(api_key=api_key)
-
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Longer questions are rejected before they reach OpenAI
+MAX_QUESTION_CHARS = int(os.getenv("MAX_QUESTION_CHARS", 2000))
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-app = FastAPI()
+router = APIRouter()
+
+# Clients and stores are created on first use rather than at import, so a
+# new worker can start serving without paying for them up front.
+_client = None
+_pwd_context = None
+_response_cache = None
+_job_queue = None
+_job_pool = None
+_admission = None
+_loop_monitor = None
+
+def check_openai_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logger.error("OpenAI API key not found in environment variables")
+        raise ValueError("OpenAI API key not found")
+    return api_key
+
+def get_openai_client():
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI(api_key=check_openai_key())
+    return _client
 
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["*"]
-)
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+def get_response_cache() -> ResponseCache:
+    # Generated answers, including ones precomputed by precompute.py
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+def get_admission() -> AdmissionController:
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+    return _admission
+
+def client_key(request: Request) -> str:
+    # /generate is anonymous, so callers are told apart by IP (see TRUSTED_PROXY_HOPS)
+    return f"ip:{client_address(request)}"
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
 
 class QuestionRequest(BaseModel):
-    question: str
+    question: str = Field(..., max_length=MAX_QUESTION_CHARS)
     userId: Optional[str] = None
 
 class BibleResponse(BaseModel):
@@ -64,62 +105,43 @@ class BibleResponse(BaseModel):
     relevance: str
     explanation: str
 
-@app.get("/")
-async def root():
-    return {"message": "Bible Verse API is running"}
-
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
+# Payloads that never change are serialized once
+ROOT_RESPONSE = StaticJSON({"message": "Bible Verse API is running"})
+HEALTH_RESPONSE = StaticJSON({"status": "healthy"}, cache_control="no-cache")
 
-async def analyze_input(text: str) -> str:
-    try:
-        prompt = f"""Analyze the following question or statement and identify:
-        1. The main theme or topic
-        2. The emotional context or situation
-        3. The type of guidance needed
-        4. Any specific Bible verses or books mentioned
-
-        Text: {text}
+@router.get("/")
+async def root(request: Request):
+    return ROOT_RESPONSE.response(request)
 
-        Provide the analysis in a structured format."""
+@router.get("/health")
+async def health_check(request: Request):
+    return HEALTH_RESPONSE.response(request)
 
-        response = await client.chat.completions.create(
+async def analyze_input(text: str) -> Analysis:
+    try:
+        # Deterministic, bounded analysis so the verse prompt stays small and stable
+        response = await chat_completion(
+            get_openai_client(),
+            "analyze",
             model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
+            messages=ANALYZE.messages(text=text),
+            temperature=0,
+            max_tokens=ANALYZE_MAX_TOKENS,
+            response_format={"type": "json_object"}
         )
         
-        return response.choices[0].message.content
+        return parse_analysis(response.choices[0].message.content, text)
     except Exception as e:
         logger.error(f"Error in analyze_input: {str(e)}")
         raise
 
-async def get_verse_application(analysis: str) -> Dict:
+async def get_verse_application(analysis: Analysis) -> Dict:
     try:
-        prompt = f"""Based on this analysis:
-        {analysis}
-
-        Please provide a response in the following exact JSON format:
-        {{
-            "verse": "The Bible verse text",
-            "reference": "Book Chapter:Verse",
-            "relevance": "Why this verse is relevant",
-            "explanation": "Practical application and guidance"
-        }}
-
-        Make sure to:
-        1. Include a relevant Bible verse
-        2. Provide the exact verse reference
-        3. Explain why this verse applies
-        4. Give practical guidance based on the verse"""
-
-        response = await client.chat.completions.create(
+        response = await chat_completion(
+            get_openai_client(),
+            "verse",
             model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides Bible verses and guidance in JSON format."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=VERSE.messages(analysis=analysis.encode()),
             temperature=0.7,
             response_format={"type": "json_object"}
         )
@@ -144,42 +166,206 @@ async def get_verse_application(analysis: str) -> Dict:
         logger.error(f"Error in get_verse_application: {str(e)}")
         raise
 
-@app.post("/generate")
-async def generate_response(request: QuestionRequest) -> Dict:
+def degraded_response(question: str, analysis: Optional[Analysis] = None) -> Dict:
+    """Fast answer from the curated verse table for when OpenAI is unavailable."""
+    entry = find_fallback_verse(themes=analysis.themes if analysis else (), text=question)
+    logger.warning(f"Serving degraded response for theme '{entry['theme']}'")
+    return {
+        "response": {
+            "verse": entry["text"],
+            "reference": entry["reference"],
+            "relevance": entry["relevance"],
+            "explanation": entry["application"]
+        },
+        "degraded": True
+    }
+
+async def run_pipeline(question: str, use_cache: bool = True, admission_key: Optional[str] = None) -> Dict:
+    """Answer from the cache, or generate one.
+
+    With `admission_key`, only generations that miss the cache go through
+    admission control, so cache hits cost no rate-limit tokens or slots.
+    Without one (jobs, precompute) generations are counted but never refused.
+    """
+    if use_cache:
+        cached = await asyncio.to_thread(get_response_cache().get, question)
+        if cached is not None:
+            logger.info("Serving cached response")
+            return cached
+    
+    analysis = None
+    admission = get_admission().admit(admission_key) if admission_key else get_admission().track()
+    try:
+        async with admission:
+            # Get the analysis
+            analysis = await analyze_input(question)
+            logger.info(f"Analysis completed ({ANALYZE.id}): {analysis.encode()!r}")
+            
+            # Get the verse application
+            response = await get_verse_application(analysis)
+            logger.info(f"Generated response: {response}")
+    except LLMUnavailableError as e:
+        logger.warning(f"OpenAI unavailable: {str(e)}")
+        # The analysis may have succeeded before the outage
+        return degraded_response(question, analysis)
+    
+    # Ensure response has the correct structure
+    if not isinstance(response, dict) or not all(key in response for key in ['verse', 'reference', 'relevance', 'explanation']):
+        logger.error(f"Invalid response structure: {response}")
+        raise HTTPException(status_code=500, detail="Invalid response structure from AI model")
+    
+    result = {"response": response, "degraded": False}
+    if use_cache:
+        await asyncio.to_thread(get_response_cache().put, question, result)
+    return result
+
+async def precompute_question(question: str) -> Dict:
+    """Generate a fresh answer and store it in the response cache."""
+    result = await run_pipeline(question, use_cache=False)
+    if result["degraded"]:
+        raise ValueError("OpenAI unavailable, not caching degraded response")
+    await asyncio.to_thread(get_response_cache().put, question, result, "precompute")
+    return result
+
+@router.post("/generate")
+async def generate_response(request: QuestionRequest, http_request: Request):
     try:
         # Log the incoming request
         logger.info(f"Received question: {request.question}")
         
-        # Get the analysis
-        analysis = await analyze_input(request.question)
-        logger.info(f"Analysis completed: {analysis}")
-        
-        # Get the verse application
-        response = await get_verse_application(analysis)
-        logger.info(f"Generated response: {response}")
-        
-        # Ensure response has the correct structure
-        if not isinstance(response, dict) or not all(key in response for key in ['verse', 'reference', 'relevance', 'explanation']):
-            logger.error(f"Invalid response structure: {response}")
-            raise HTTPException(status_code=500, detail="Invalid response structure from AI model")
-        
-        result = {"response": response}
+        result = await run_pipeline(request.question, admission_key=client_key(http_request))
         logger.info(f"Sending final response: {result}")
         
-        # Return the response with CORS headers
-        return JSONResponse(
-            content=result,
-            headers={
-                "Access-Control-Allow-Origin": "http://localhost:3000",
-                "Access-Control-Allow-Credentials": "true",
-                "Access-Control-Allow-Methods": "POST, OPTIONS",
-                "Access-Control-Allow-Headers": "Content-Type"
-            }
-        )
+        # CORS headers are added by CORSMiddleware
+        return cached_json(http_request, result)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in generate_response: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Asynchronous jobs: submit with POST /jobs, then poll GET /jobs/{id}
+async def run_generate_job(payload: Dict) -> Dict:
+    return await run_pipeline(payload["question"])
+
+@router.post("/jobs", status_code=202)
+async def submit_job(request: QuestionRequest, http_request: Request, idempotency_key: Optional[str] = Header(None)):
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    # userId is not authenticated, so keys are scoped per caller address;
+    # a reused key with a different question is rejected rather than shared
+    key = f"{client_key(http_request)}:{idempotency_key}" if idempotency_key else None
+    try:
+        job = await asyncio.to_thread(get_job_queue().find, key, request.dict()) if key else None
+        created = False
+        if job is None:
+            # Only new jobs cost a rate-limit token; a retried key gets its job back
+            await get_admission().check_rate(client_key(http_request))
+            job, created = await asyncio.to_thread(
+                get_job_queue().submit, request.dict(), key, request.userId
+            )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    logger.info(f"{'Queued' if created else 'Reused'} job {job['id']}")
+    if created and _job_pool is not None:
+        _job_pool.notify()
+    return DefaultResponse(
+        content=public_job(job),
+        status_code=202 if created else 200,
+        headers={"Location": f"/jobs/{job['id']}"}
+    )
+
+@router.get("/llm/metrics")
+async def get_llm_metrics():
+    metrics = llm_metrics()
+    metrics["admission"] = get_admission().snapshot()
+    return metrics
+
+@router.get("/jobs/metrics")
+async def job_metrics():
+    metrics = await asyncio.to_thread(_job_pool.metrics if _job_pool else get_job_queue().metrics)
+    metrics["response_cache"] = get_response_cache().metrics()
+    return metrics
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    # Finished jobs don't change until they expire
+    finished = job["finished_at"] is not None
+    return cached_json(request, public_job(job), "private, max-age=300" if finished else "no-cache")
+
+# Admin-only profiling; see profiling.py
+@router.get("/admin/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def profile(seconds: float = 10, all_threads: bool = False):
+    return await profile_window(seconds, all_threads)
+
+@router.get("/admin/profile/requests/{profile_id}", dependencies=[Depends(require_admin)])
+async def request_profile(profile_id: str):
+    profile = get_request_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@router.get("/admin/loop-lag", dependencies=[Depends(require_admin)])
+async def loop_lag():
+    if _loop_monitor is None:
+        raise HTTPException(status_code=404, detail="Loop lag monitor is disabled")
+    return _loop_monitor.snapshot()
+
+def preload() -> None:
+    """Import heavy dependencies and load read-only data.
+
+    Called from wsgi.py when PRELOAD_APP is set, so that with gunicorn
+    --preload this happens once in the master and forked workers share it.
+    """
+    import openai  # noqa: F401
+    get_response_cache().load()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _job_pool, _loop_monitor
+    check_openai_key()
+    if LOOP_LAG_MONITOR:
+        _loop_monitor = LoopLagMonitor()
+        _loop_monitor.start()
+    cache = get_response_cache()
+    if not cache.loaded:
+        await asyncio.to_thread(cache.load)
+    _job_pool = JobWorkerPool(get_job_queue(), run_generate_job)
+    await _job_pool.start()
+    yield
+    await _job_pool.stop()
+    _job_pool = None
+    if _loop_monitor is not None:
+        await _loop_monitor.stop()
+        _loop_monitor = None
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan, default_response_class=DefaultResponse)
+    
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["*"]
+    )
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(router)
+    return app
+
+def __getattr__(name: str):
+    # Keep `uvicorn app:app` working without building the app at import time
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
+    uvicorn.run(create_app(), host="0.0.0.0", port=8001, log_level="info")
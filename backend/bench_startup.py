@@ -0,0 +1,77 @@
+"""Measure how long a fresh worker takes to start serving.
+
+Each run starts a new interpreter, imports the WSGI entry point, runs the
+app's lifespan startup and serves one GET /health, timing each step:
+
+    python bench_startup.py --runs 10
+    cd hostinger_deployment && python ../bench_startup.py --module passenger_wsgi --attr application
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+WORKER = r'''
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+module = __import__(sys.argv[1])
+app = getattr(module, sys.argv[2])
+t1 = time.perf_counter()
+
+async def first_request():
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    async with app.router.lifespan_context(app):
+        t2 = time.perf_counter()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": "/health", "raw_path": b"/health",
+            "query_string": b"", "root_path": "", "headers": [(b"host", b"localhost")],
+            "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 8001),
+        }
+        await app(scope, receive, send)
+        t3 = time.perf_counter()
+    status = next(m["status"] for m in messages if m["type"] == "http.response.start")
+    return t2, t3, status
+
+t2, t3, status = asyncio.run(first_request())
+print(json.dumps({"import": t1 - t0, "startup": t2 - t1, "first_request": t3 - t2, "total": t3 - t0, "status": status}))
+'''
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark worker cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default="wsgi")
+    parser.add_argument("--attr", default="app")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "bench")
+    env.setdefault("JOB_WORKERS", "1")
+
+    results = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-c", WORKER, args.module, args.attr],
+            env=env, capture_output=True, text=True, check=True
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    for step in ("import", "startup", "first_request", "total"):
+        values = [r[step] * 1000 for r in results]
+        print(f"{step:>14}: median {statistics.median(values):7.1f} ms  max {max(values):7.1f} ms")
+    statuses = {r["status"] for r in results}
+    print(f"{'status':>14}: {', '.join(str(s) for s in sorted(statuses))}")
+
+
+if __name__ == "__main__":
+    main()
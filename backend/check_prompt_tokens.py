@@ -0,0 +1,61 @@
+"""Token-count regression check for the prompt templates in prompts.py.
+
+Renders each template with its sample input, estimates prompt tokens
+(~4 characters per token, so results don't depend on what's installed)
+and fails if a template is over its budget. It also fails if a template's
+text changed without a version bump, using the fingerprints in
+prompt_versions.json:
+
+    python check_prompt_tokens.py
+    python check_prompt_tokens.py --update   # after bumping a version
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from prompts import TEMPLATES, count_tokens, prompt_tokens
+
+VERSIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_versions.json")
+
+
+def fingerprint(template) -> str:
+    return hashlib.sha256(f"{template.system}\0{template.user}".encode("utf-8")).hexdigest()[:16]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check prompt template token budgets")
+    parser.add_argument("--update", action="store_true", help="record the current template fingerprints")
+    args = parser.parse_args()
+
+    recorded = {}
+    if os.path.exists(VERSIONS_PATH):
+        with open(VERSIONS_PATH) as f:
+            recorded = json.load(f)
+
+    failures = []
+    for template in TEMPLATES:
+        tokens = prompt_tokens(template.messages(**template.sample))
+        prefix = count_tokens(template.system)
+        print(f"{template.id:>12}: {tokens:4d} tokens (budget {template.max_prompt_tokens}, "
+              f"static prefix {prefix})")
+        if tokens > template.max_prompt_tokens:
+            failures.append(f"{template.id} is over budget: {tokens} > {template.max_prompt_tokens}")
+        known = recorded.get(template.id)
+        if known and known != fingerprint(template) and not args.update:
+            failures.append(f"{template.id} changed without a version bump")
+
+    if args.update:
+        with open(VERSIONS_PATH, "w") as f:
+            json.dump({t.id: fingerprint(t) for t in TEMPLATES}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Recorded fingerprints in {VERSIONS_PATH}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Local stand-in for the OpenAI chat completions API with injected latency.
+
+Run it next to the backend to exercise timeouts, hedging and the circuit
+breaker without calling OpenAI:
+
+    uvicorn fake_openai:app --port 9000
+    OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=test LLM_HEDGING=true uvicorn app:app --port 8001
+
+Latency and failures are controlled with environment variables:
+FAKE_OPENAI_LATENCY_MS (base latency), FAKE_OPENAI_SLOW_RATE and
+FAKE_OPENAI_SLOW_MS (fraction of slow responses and their latency),
+FAKE_OPENAI_ERROR_RATE (fraction of 500 responses).
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from fallback_verses import find_fallback_verse
+
+LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", 200))
+SLOW_RATE = float(os.getenv("FAKE_OPENAI_SLOW_RATE", 0.05))
+SLOW_MS = float(os.getenv("FAKE_OPENAI_SLOW_MS", 10000))
+ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", 0.0))
+
+app = FastAPI()
+
+stats = {"requests": 0, "cancelled": 0, "errors": 0}
+
+
+def fake_content(messages: list) -> str:
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = messages[-1]["content"] if messages else ""
+    entry = find_fallback_verse(text=user)
+
+    if "Classify the user's message" in system:
+        return json.dumps({
+            "themes": [entry["theme"]],
+            "sentiment": "anxious",
+            "context": user[:120],
+            "refs": []
+        })
+    if "analyzing human emotions" in system:
+        return json.dumps({
+            "keywords": [entry["theme"]],
+            "sentiment": "concerned",
+            "context": user[:200],
+            "potential_themes": [entry["theme"]]
+        })
+    if "most relevant Bible verse" in system:
+        return json.dumps({
+            "verse": {
+                "reference": entry["reference"],
+                "text": entry["text"],
+                "relevance_score": "8",
+                "reason": entry["relevance"]
+            }
+        })
+    if "apply Bible verses" in system:
+        return json.dumps({"application": entry["application"]})
+    if "JSON" in system:
+        return json.dumps({
+            "verse": entry["text"],
+            "reference": entry["reference"],
+            "relevance": entry["relevance"],
+            "explanation": entry["application"]
+        })
+    return f"1. Theme: {entry['theme']}\n2. Context: {user[:200]}\n3. Guidance needed: encouragement\n4. Verses mentioned: none"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+
+    latency = SLOW_MS if random.random() < SLOW_RATE else LATENCY_MS
+    try:
+        await asyncio.sleep(latency / 1000)
+    except asyncio.CancelledError:
+        stats["cancelled"] += 1
+        raise
+
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "Injected failure", "type": "server_error"}}
+        )
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-3.5-turbo"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": fake_content(body.get("messages", []))},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
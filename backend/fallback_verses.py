@@ -0,0 +1,168 @@
+import re
+from typing import Dict, Iterable, List
+
+# Curated theme -> verse table used when OpenAI is unavailable.
+# Verse texts are from the King James Version (public domain).
+THEME_VERSES: Dict[str, Dict[str, str]] = {
+    "anxiety": {
+        "reference": "Philippians 4:6-7",
+        "text": "Be careful for nothing; but in every thing by prayer and supplication with thanksgiving let your requests be made known unto God. And the peace of God, which passeth all understanding, shall keep your hearts and minds through Christ Jesus.",
+        "relevance": "Paul speaks directly to worry, inviting us to bring every concern to God in prayer.",
+        "application": "Name the things weighing on you and bring each one to God in prayer, thanking Him for what He has already done. Let His peace guard your heart instead of rehearsing the worry.",
+    },
+    "fear": {
+        "reference": "Isaiah 41:10",
+        "text": "Fear thou not; for I am with thee: be not dismayed; for I am thy God: I will strengthen thee; yea, I will help thee; yea, I will uphold thee with the right hand of my righteousness.",
+        "relevance": "God answers fear with His presence and His promise to strengthen and uphold.",
+        "application": "When fear rises, remind yourself that you are not facing this alone. Take the next step trusting that God will strengthen and hold you up.",
+    },
+    "grief": {
+        "reference": "Psalm 34:18",
+        "text": "The LORD is nigh unto them that are of a broken heart; and saveth such as be of a contrite spirit.",
+        "relevance": "This psalm promises God's nearness to those who are hurting and brokenhearted.",
+        "application": "Bring your sorrow honestly to God rather than hiding it. Lean on His nearness and on people who can grieve alongside you.",
+    },
+    "healing": {
+        "reference": "Jeremiah 17:14",
+        "text": "Heal me, O LORD, and I shall be healed; save me, and I shall be saved: for thou art my praise.",
+        "relevance": "Jeremiah's prayer models bringing the need for healing directly to God.",
+        "application": "Pray boldly for healing for yourself or your loved one. Keep praising God through the waiting and accept the care and support He provides through others.",
+    },
+    "forgiveness": {
+        "reference": "Ephesians 4:32",
+        "text": "And be ye kind one to another, tenderhearted, forgiving one another, even as God for Christ's sake hath forgiven you.",
+        "relevance": "Our forgiveness of others flows from the forgiveness God has already given us.",
+        "application": "Remember how much you have been forgiven, then choose to release the debt someone owes you. Forgiveness can be a decision before it is a feeling.",
+    },
+    "guidance": {
+        "reference": "Proverbs 3:5-6",
+        "text": "Trust in the LORD with all thine heart; and lean not unto thine own understanding. In all thy ways acknowledge him, and he shall direct thy paths.",
+        "relevance": "This proverb promises direction to those who trust God with their decisions.",
+        "application": "Bring the decision to God in prayer and hold your own reasoning loosely. Seek wise counsel, then move forward trusting Him to direct your path.",
+    },
+    "strength": {
+        "reference": "Isaiah 40:31",
+        "text": "But they that wait upon the LORD shall renew their strength; they shall mount up with wings as eagles; they shall run, and not be weary; and they shall walk, and not faint.",
+        "relevance": "God promises renewed strength to those who are worn out and wait on Him.",
+        "application": "Rest in God rather than pushing on in your own strength. Set aside time to wait on Him and let Him renew you for what lies ahead.",
+    },
+    "love": {
+        "reference": "1 John 4:7",
+        "text": "Beloved, let us love one another: for love is of God; and every one that loveth is born of God, and knoweth God.",
+        "relevance": "John roots our love for others in the love that comes from God Himself.",
+        "application": "Look for one practical way to show love today, especially where it is hard. Let God's love for you be the source of the love you give.",
+    },
+    "hope": {
+        "reference": "Jeremiah 29:11",
+        "text": "For I know the thoughts that I think toward you, saith the LORD, thoughts of peace, and not of evil, to give you an expected end.",
+        "relevance": "God reminds His people that He holds their future and His plans for them are good.",
+        "application": "When the future looks uncertain, hold on to God's good intentions toward you. Take today's step faithfully and leave tomorrow with Him.",
+    },
+    "peace": {
+        "reference": "John 14:27",
+        "text": "Peace I leave with you, my peace I give unto you: not as the world giveth, give I unto you. Let not your heart be troubled, neither let it be afraid.",
+        "relevance": "Jesus offers a peace that does not depend on circumstances.",
+        "application": "Receive the peace Jesus offers by quieting your heart before Him. Let that peace, not your circumstances, set the tone for your day.",
+    },
+    "faith": {
+        "reference": "Hebrews 11:1",
+        "text": "Now faith is the substance of things hoped for, the evidence of things not seen.",
+        "relevance": "Faith is confidence in God's promises even before we see them fulfilled.",
+        "application": "Hold on to what God has promised even when you cannot see the outcome yet. Act on that trust in one concrete way today.",
+    },
+    "loneliness": {
+        "reference": "Deuteronomy 31:6",
+        "text": "Be strong and of a good courage, fear not, nor be afraid of them: for the LORD thy God, he it is that doth go with thee; he will not fail thee, nor forsake thee.",
+        "relevance": "God promises never to leave or forsake His people.",
+        "application": "Remember that God is with you even when you feel alone. Reach out to a friend or church community and let them be part of His care for you.",
+    },
+    "anger": {
+        "reference": "James 1:19-20",
+        "text": "Wherefore, my beloved brethren, let every man be swift to hear, slow to speak, slow to wrath: For the wrath of man worketh not the righteousness of God.",
+        "relevance": "James gives practical wisdom for handling anger before it does harm.",
+        "application": "Pause and listen before you respond. Give your anger to God and choose words that build up rather than tear down.",
+    },
+    "gratitude": {
+        "reference": "1 Thessalonians 5:18",
+        "text": "In every thing give thanks: for this is the will of God in Christ Jesus concerning you.",
+        "relevance": "Thankfulness is God's will for us in every circumstance.",
+        "application": "Write down a few things you are thankful for today, even small ones. Thank God for them in prayer.",
+    },
+    "provision": {
+        "reference": "Philippians 4:19",
+        "text": "But my God shall supply all your need according to his riches in glory by Christ Jesus.",
+        "relevance": "Paul assures believers that God will meet their needs.",
+        "application": "Bring your practical needs to God honestly. Be a wise steward of what you have and trust Him to provide what you lack.",
+    },
+    "wisdom": {
+        "reference": "James 1:5",
+        "text": "If any of you lack wisdom, let him ask of God, that giveth to all men liberally, and upbraideth not; and it shall be given him.",
+        "relevance": "God promises wisdom generously to anyone who asks.",
+        "application": "Ask God specifically for wisdom in this situation. Then pay attention to Scripture, wise counsel, and the peace He gives as you decide.",
+    },
+    "perseverance": {
+        "reference": "Galatians 6:9",
+        "text": "And let us not be weary in well doing: for in due season we shall reap, if we faint not.",
+        "relevance": "Paul encourages those who are tired of doing good that their effort is not wasted.",
+        "application": "Keep doing what is right even when you don't see results yet. Trust that God will bring a harvest in His timing.",
+    },
+    "rest": {
+        "reference": "Matthew 11:28",
+        "text": "Come unto me, all ye that labour and are heavy laden, and I will give you rest.",
+        "relevance": "Jesus invites everyone who is weary and burdened to find rest in Him.",
+        "application": "Bring whatever is weighing on you to Jesus today. Accept His invitation to rest rather than carrying it all yourself.",
+    },
+}
+
+DEFAULT_THEME = "rest"
+
+# Words that point at a theme when the analysis (or the raw question) mentions them
+THEME_KEYWORDS: Dict[str, List[str]] = {
+    "anxiety": ["anxiety", "anxious", "worry", "worried", "stress", "stressed", "nervous", "overwhelmed"],
+    "fear": ["fear", "afraid", "scared", "terrified", "courage"],
+    "grief": ["grief", "grieving", "loss", "died", "death", "mourning", "heartbroken", "sorrow"],
+    "healing": ["healing", "heal", "sick", "sickness", "illness", "cancer", "disease", "surgery", "hospital"],
+    "forgiveness": ["forgive", "forgiveness", "forgiving", "resentment", "grudge", "betrayed", "guilt"],
+    "guidance": ["decision", "decide", "choice", "direction", "guidance", "job", "career", "future", "calling"],
+    "strength": ["strength", "tired", "weary", "exhausted", "weak", "burnout"],
+    "love": ["love", "marriage", "relationship", "family", "husband", "wife", "friendship"],
+    "hope": ["hope", "hopeless", "despair", "uncertain", "uncertainty"],
+    "peace": ["peace", "calm", "troubled", "restless", "conflict"],
+    "faith": ["faith", "doubt", "doubting", "believe", "trust"],
+    "loneliness": ["lonely", "loneliness", "alone", "isolated", "abandoned", "rejected"],
+    "anger": ["anger", "angry", "rage", "frustrated", "frustration", "bitter"],
+    "gratitude": ["grateful", "gratitude", "thankful", "thanks", "blessed"],
+    "provision": ["money", "finances", "financial", "debt", "bills", "provision", "unemployed", "need"],
+    "wisdom": ["wisdom", "wise", "understand", "understanding", "confused", "memorize"],
+    "perseverance": ["persevere", "perseverance", "give up", "discouraged", "patience", "waiting"],
+    "rest": ["rest", "burden", "burdened", "sleep"],
+}
+
+_WORD_RE = re.compile(r"[a-z']+")
+
+
+def match_theme(themes: Iterable[str] = (), keywords: Iterable[str] = (), text: str = "") -> str:
+    """Pick the curated theme that best matches an analysis or raw text."""
+    scores: Dict[str, int] = {}
+
+    # Themes from the analysis count most, then keywords, then the raw text
+    for weight, phrases in ((3, themes), (2, keywords), (1, [text])):
+        for phrase in phrases:
+            phrase = (phrase or "").lower()
+            if phrase in THEME_VERSES:
+                scores[phrase] = scores.get(phrase, 0) + weight
+            words = set(_WORD_RE.findall(phrase))
+            for theme, theme_keywords in THEME_KEYWORDS.items():
+                hits = sum(1 for kw in theme_keywords if (kw in phrase if " " in kw else kw in words))
+                if hits:
+                    scores[theme] = scores.get(theme, 0) + weight * hits
+
+    if not scores:
+        return DEFAULT_THEME
+    return max(scores, key=lambda theme: scores[theme])
+
+
+def find_fallback_verse(themes: Iterable[str] = (), keywords: Iterable[str] = (), text: str = "") -> Dict[str, str]:
+    """Return the curated verse entry for the best matching theme."""
+    theme = match_theme(themes, keywords, text)
+    return dict(THEME_VERSES[theme], theme=theme)
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+# Admission control configuration
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", 10))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", 5))
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 64))
+LATENCY_SLO_SECONDS = float(os.getenv("LATENCY_SLO_SECONDS", 20))
+SHED_MIN_IN_FLIGHT = int(os.getenv("SHED_MIN_IN_FLIGHT", 8))
+# "memory" keeps buckets per process; "sqlite" shares them between workers
+ADMISSION_STORE = os.getenv("ADMISSION_STORE", "memory")
+ADMISSION_DB_PATH = os.getenv(
+    "ADMISSION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "admission.db")
+)
+MAX_TRACKED_KEYS = 10000
+# Proxies in front of the app that append to X-Forwarded-For (1 for the Heroku router)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+
+
+def client_address(request: Request, hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """The caller's address, as seen by the outermost trusted proxy.
+
+    Each proxy appends the peer it saw to X-Forwarded-For, so only the last
+    `hops` entries are trustworthy; anything left of them was sent by the
+    client and is ignored.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if hops <= 0:
+        return peer
+    forwarded = [
+        entry.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for entry in header.split(",")
+        if entry.strip()
+    ]
+    if not forwarded:
+        return peer
+    return forwarded[-min(hops, len(forwarded))]
+
+
+class MemoryBuckets:
+    """Token buckets kept in this process, least recently used keys evicted first."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = MAX_TRACKED_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str) -> float:
+        """Take a token for `key`. Returns 0 if allowed, else seconds until one is available."""
+        now = time.time()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class SQLiteBuckets:
+    """Token buckets in a local SQLite file so every worker enforces the same limit."""
+
+    def __init__(self, rate: float, burst: float, path: str = ADMISSION_DB_PATH):
+        self.rate = rate
+        self.burst = burst
+        self.path = path
+        with self._connection() as conn:
+            conn.execute(
+                "create table if not exists buckets (key text primary key, tokens real not null, updated real not null)"
+            )
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("pragma journal_mode=wal")
+            yield conn
+        finally:
+            conn.close()
+
+    def take(self, key: str) -> float:
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("begin immediate")
+            try:
+                row = conn.execute("select tokens, updated from buckets where key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (self.burst, now)
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / self.rate
+                conn.execute(
+                    "insert or replace into buckets (key, tokens, updated) values (?, ?, ?)",
+                    (key, tokens, now)
+                )
+                # Buckets idle long enough to be full again carry no state
+                conn.execute(
+                    "delete from buckets where updated < ?", (now - self.burst / self.rate - 60,)
+                )
+                conn.execute("commit")
+            except Exception:
+                conn.execute("rollback")
+                raise
+        return wait
+
+
+class AdmissionController:
+    """Decides whether a generation request may start.
+
+    Requests are refused with 429 when the caller is over their rate limit,
+    when this worker already has MAX_IN_FLIGHT generations running, or when
+    recent generations are taking longer than the latency SLO while a
+    backlog is building, since a new request would only queue behind them.
+    """
+
+    def __init__(self, rate_per_minute: float = RATE_LIMIT_PER_MINUTE, burst: float = RATE_LIMIT_BURST,
+                 max_in_flight: int = MAX_IN_FLIGHT, latency_slo: float = LATENCY_SLO_SECONDS,
+                 shed_min_in_flight: int = SHED_MIN_IN_FLIGHT, store: str = ADMISSION_STORE):
+        rate = rate_per_minute / 60
+        self.buckets = SQLiteBuckets(rate, burst) if store == "sqlite" else MemoryBuckets(rate, burst)
+        self.max_in_flight = max_in_flight
+        self.latency_slo = latency_slo
+        self.shed_min_in_flight = shed_min_in_flight
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.rejected: Dict[str, int] = {"rate_limited": 0, "in_flight": 0, "latency_slo": 0}
+
+    @staticmethod
+    def _reject(reason: str, detail: str, retry_after: float) -> HTTPException:
+        return HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def check_rate(self, key: str) -> None:
+        """Apply only the per-caller rate limit."""
+        if isinstance(self.buckets, SQLiteBuckets):
+            wait = await asyncio.to_thread(self.buckets.take, key)
+        else:
+            wait = self.buckets.take(key)
+        if wait > 0:
+            self.rejected["rate_limited"] += 1
+            logger.warning(f"Rate limited {key}")
+            raise self._reject("rate_limited", "Too many requests, please slow down", wait)
+
+    def _check_load(self) -> None:
+        if self.in_flight >= self.max_in_flight:
+            self.rejected["in_flight"] += 1
+            logger.warning(f"Shedding request: {self.in_flight} generations in flight")
+            raise self._reject("in_flight", "Server is busy, please retry shortly", self.latency_ewma or 5)
+        if (self.latency_ewma is not None and self.latency_ewma > self.latency_slo
+                and self.in_flight >= self.shed_min_in_flight):
+            self.rejected["latency_slo"] += 1
+            logger.warning(f"Shedding request: latency {self.latency_ewma:.1f}s over SLO")
+            raise self._reject("latency_slo", "Server is busy, please retry shortly", self.latency_ewma)
+
+    def _observe(self, latency: float) -> None:
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+
+    @asynccontextmanager
+    async def admit(self, key: str):
+        """Hold a generation slot for `key` for the duration of the block."""
+        # Check load first so shed requests don't also spend the caller's tokens
+        self._check_load()
+        await self.check_rate(key)
+        async with self.track():
+            yield
+
+    @asynccontextmanager
+    async def track(self):
+        """Count a generation that was already admitted, such as a queued job.
+
+        It is never refused, but it occupies a slot and feeds the latency
+        average, so interactive requests are shed when jobs are backing up.
+        """
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._observe(time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "latency_ewma_seconds": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "latency_slo_seconds": self.latency_slo,
+            "rejected": dict(self.rejected),
+        }
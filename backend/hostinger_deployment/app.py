@@ -1,23 +1,29 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Depends, Header
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
 import asyncio
+import time
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, Response
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-import httpx
 import json
 from urllib.parse import urlencode
-from openai import AsyncOpenAI
 from config import Config
+from jobs import IdempotencyConflict, JobQueue, JobWorkerPool, public_job
+from llm import chat_completion, llm_metrics, LLMUnavailableError
+from fallback_verses import find_fallback_verse
+from response_cache import ResponseCache
+from admission import AdmissionController, client_address
+from offline_pack import (OFFLINE_PACK_MIN_REFRESH_SECONDS, OfflinePack, OfflinePackStore,
+                          build_pack, is_chunk_hash)
+from http_cache import DefaultResponse, StaticJSON, cached_json, not_modified
+from profiling import (LOOP_LAG_MONITOR, LoopLagMonitor, ProfilingMiddleware,
+                       get_request_profile, profile_window, require_admin)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -33,40 +39,86 @@ FACEBOOK_APP_ID = os.getenv("FACEBOOK_APP_ID")
 FACEBOOK_APP_SECRET = os.getenv("FACEBOOK_APP_SECRET")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
-# Configure OpenAI
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    logger.error("OpenAI API key not found in environment variables")
-    raise ValueError("OpenAI API key not found")
-
-# Supabase setup
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
-
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Longer questions are rejected before they reach OpenAI
+MAX_QUESTION_CHARS = int(os.getenv("MAX_QUESTION_CHARS", 2000))
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-client = AsyncOpenAI(api_key=api_key)
-
-app = FastAPI()
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=Config.CORS_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+router = APIRouter()
+
+# Clients and stores are created on first use rather than at import, so a
+# new worker can start serving without paying for them up front.
+_client = None
+_supabase = None
+_pwd_context = None
+_response_cache = None
+_job_queue = None
+_job_pool = None
+_admission = None
+_offline_packs = None
+_loop_monitor = None
+
+def check_openai_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logger.error("OpenAI API key not found in environment variables")
+        raise ValueError("OpenAI API key not found")
+    return api_key
+
+def get_openai_client():
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI(api_key=check_openai_key())
+    return _client
+
+def get_supabase():
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+        _supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    return _supabase
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+def get_response_cache() -> ResponseCache:
+    # Generated answers, including ones precomputed by precompute.py
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+def get_admission() -> AdmissionController:
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+    return _admission
+
+def client_key(request: Request) -> str:
+    return f"ip:{client_address(request)}"
+
+def get_offline_packs() -> OfflinePackStore:
+    global _offline_packs
+    if _offline_packs is None:
+        _offline_packs = OfflinePackStore()
+    return _offline_packs
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
 
 # Models
 class Token(BaseModel):
@@ -83,6 +135,7 @@ class User(BaseModel):
     oauth_id: Optional[str] = None
 
 class UserInDB(User):
+    id: Optional[str] = None
     hashed_password: Optional[str] = None
 
 class UserCreate(User):
@@ -103,9 +156,10 @@ class VerseApplication(BaseModel):
     verse_text: str
     relevance_rationale: str
     application: str
+    degraded: bool = False
 
 class TextRequest(BaseModel):
-    text: str
+    text: str = Field(..., max_length=MAX_QUESTION_CHARS)
 
 class PasswordReset(BaseModel):
     email: str
@@ -115,10 +169,11 @@ class PasswordResetConfirm(BaseModel):
     new_password: str
 
 class QuestionRequest(BaseModel):
-    question: str
+    question: str = Field(..., max_length=MAX_QUESTION_CHARS)
 
 # OAuth functions
 async def verify_google_token(token: str) -> dict:
+    import httpx
     async with httpx.AsyncClient() as client:
         response = await client.get(
             f"https://www.googleapis.com/oauth2/v3/userinfo",
@@ -129,6 +184,7 @@ async def verify_google_token(token: str) -> dict:
         return response.json()
 
 async def verify_facebook_token(token: str) -> dict:
+    import httpx
     async with httpx.AsyncClient() as client:
         # Get user info from Facebook
         try:
@@ -150,7 +206,7 @@ async def verify_facebook_token(token: str) -> dict:
 
 async def get_or_create_social_user(email: str, oauth_id: str, oauth_provider: str) -> User:
     try:
-        response = supabase.table('users').select("*").eq('oauth_id', oauth_id).execute()
+        response = get_supabase().table('users').select("*").eq('oauth_id', oauth_id).execute()
         if response.data:
             user_data = response.data[0]
             return UserInDB(**user_data)
@@ -166,7 +222,7 @@ async def get_or_create_social_user(email: str, oauth_id: str, oauth_provider: s
             "oauth_provider": oauth_provider,
             "oauth_id": oauth_id
         }
-        response = supabase.table('users').insert(user_data).execute()
+        response = get_supabase().table('users').insert(user_data).execute()
         
         if response.data:
             return UserInDB(**user_data)
@@ -182,7 +238,7 @@ async def get_or_create_social_user(email: str, oauth_id: str, oauth_provider: s
         )
 
 # Social login endpoints
-@app.post("/auth/google", response_model=SocialAuthResponse)
+@router.post("/auth/google", response_model=SocialAuthResponse)
 async def google_auth(request: Request):
     try:
         body = await request.json()
@@ -203,7 +259,7 @@ async def google_auth(request: Request):
         logger.error(f"Google auth error: {str(e)}")
         raise HTTPException(status_code=400, detail="Google authentication failed")
 
-@app.post("/auth/facebook", response_model=SocialAuthResponse)
+@router.post("/auth/facebook", response_model=SocialAuthResponse)
 async def facebook_auth(request: Request):
     try:
         body = await request.json()
@@ -224,31 +280,34 @@ async def facebook_auth(request: Request):
         logger.error(f"Facebook auth error: {str(e)}")
         raise HTTPException(status_code=400, detail="Facebook authentication failed")
 
-# OAuth configuration endpoints
-@app.get("/auth/google/config")
-async def google_config():
-    return {
-        "clientId": GOOGLE_CLIENT_ID,
-        "redirectUri": f"{FRONTEND_URL}/auth/google/callback"
-    }
+# OAuth configuration endpoints, serialized once since the config is fixed at startup
+GOOGLE_CONFIG_RESPONSE = StaticJSON({
+    "clientId": GOOGLE_CLIENT_ID,
+    "redirectUri": f"{FRONTEND_URL}/auth/google/callback"
+}, cache_control="public, max-age=3600")
+FACEBOOK_CONFIG_RESPONSE = StaticJSON({
+    "appId": FACEBOOK_APP_ID,
+    "redirectUri": f"{FRONTEND_URL}/auth/facebook/callback"
+}, cache_control="public, max-age=3600")
 
-@app.get("/auth/facebook/config")
-async def facebook_config():
-    return {
-        "appId": FACEBOOK_APP_ID,
-        "redirectUri": f"{FRONTEND_URL}/auth/facebook/callback"
-    }
+@router.get("/auth/google/config")
+async def google_config(request: Request):
+    return GOOGLE_CONFIG_RESPONSE.response(request)
+
+@router.get("/auth/facebook/config")
+async def facebook_config(request: Request):
+    return FACEBOOK_CONFIG_RESPONSE.response(request)
 
 # Authentication functions
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 async def get_user(username: str):
     try:
-        response = supabase.table('users').select("*").eq('username', username).execute()
+        response = get_supabase().table('users').select("*").eq('username', username).execute()
         if response.data:
             user_data = response.data[0]
             return UserInDB(**user_data)
@@ -267,6 +326,7 @@ async def authenticate_user(username: str, password: str):
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -277,6 +337,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    from jose import JWTError, jwt
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -296,7 +357,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     return user
 
 # Auth endpoints
-@app.post("/token", response_model=Token)
+@router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     user = await authenticate_user(form_data.username, form_data.password)
     if not user:
@@ -311,17 +372,17 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/register", response_model=User)
+@router.post("/register", response_model=User)
 async def register_user(user: UserCreate):
     try:
-        response = supabase.table('users').select("*").eq('username', user.username).execute()
+        response = get_supabase().table('users').select("*").eq('username', user.username).execute()
         if response.data:
             raise HTTPException(
                 status_code=400,
                 detail="Username already registered"
             )
         
-        response = supabase.table('users').select("*").eq('email', user.email).execute()
+        response = get_supabase().table('users').select("*").eq('email', user.email).execute()
         if response.data:
             raise HTTPException(
                 status_code=400,
@@ -334,7 +395,7 @@ async def register_user(user: UserCreate):
             "email": user.email,
             "hashed_password": hashed_password
         }
-        response = supabase.table('users').insert(user_data).execute()
+        response = get_supabase().table('users').insert(user_data).execute()
         
         if response.data:
             return User(username=user.username, email=user.email)
@@ -350,12 +411,12 @@ async def register_user(user: UserCreate):
         )
 
 # Protected route example
-@app.get("/users/me", response_model=User)
+@router.get("/users/me", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 # Password reset endpoints
-@app.post("/reset-password")
+@router.post("/reset-password")
 async def request_password_reset(reset_request: PasswordReset):
     user = await get_user_by_email(reset_request.email)
     if not user:
@@ -377,8 +438,9 @@ async def request_password_reset(reset_request: PasswordReset):
         "debug_token": reset_token  # Remove this in production
     }
 
-@app.post("/reset-password/confirm")
+@router.post("/reset-password/confirm")
 async def confirm_password_reset(reset_confirm: PasswordResetConfirm):
+    from jose import JWTError, jwt
     try:
         # Verify the token
         payload = jwt.decode(reset_confirm.token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -405,7 +467,7 @@ async def confirm_password_reset(reset_confirm: PasswordResetConfirm):
     # Hash the new password and update in database
     hashed_password = get_password_hash(reset_confirm.new_password)
     try:
-        response = supabase.table('users').update({"hashed_password": hashed_password}).eq('username', username).execute()
+        response = get_supabase().table('users').update({"hashed_password": hashed_password}).eq('username', username).execute()
         if response.data:
             return {"message": "Password has been reset successfully"}
         else:
@@ -422,7 +484,7 @@ async def confirm_password_reset(reset_confirm: PasswordResetConfirm):
 # Helper function to get user by email
 async def get_user_by_email(email: str):
     try:
-        response = supabase.table('users').select("*").eq('email', email).execute()
+        response = get_supabase().table('users').select("*").eq('email', email).execute()
         if response.data:
             user_data = response.data[0]
             return UserInDB(**user_data)
@@ -434,7 +496,9 @@ async def get_user_by_email(email: str):
 async def analyze_input(text: str) -> InputAnalysis:
     try:
         logger.info(f"Generating input analysis for text: {text[:100]}...")
-        response = await client.chat.completions.create(
+        response = await chat_completion(
+            get_openai_client(),
+            "analyze",
             model="gpt-3.5-turbo",
             messages=[
                 {
@@ -449,7 +513,6 @@ async def analyze_input(text: str) -> InputAnalysis:
         )
         
         # Parse the AI response
-        import json
         analysis_data = json.loads(response.choices[0].message.content)
         logger.info("Successfully generated input analysis")
         return InputAnalysis(
@@ -461,6 +524,8 @@ async def analyze_input(text: str) -> InputAnalysis:
     except json.JSONDecodeError as e:
         logger.error(f"Error parsing AI response: {str(e)}")
         raise HTTPException(status_code=500, detail="Error processing AI response")
+    except LLMUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error generating input analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -473,7 +538,9 @@ async def get_verse_application(analysis: InputAnalysis) -> VerseApplication:
         
         # Get a single most relevant verse
         logger.info("Requesting most relevant verse...")
-        verse_response = await client.chat.completions.create(
+        verse_response = await chat_completion(
+            get_openai_client(),
+            "verse",
             model="gpt-3.5-turbo",
             messages=[
                 {
@@ -487,14 +554,15 @@ async def get_verse_application(analysis: InputAnalysis) -> VerseApplication:
             ]
         )
         
-        import json
         verse_data = json.loads(verse_response.choices[0].message.content)
         selected_verse = verse_data["verse"]
         logger.info(f"Selected verse: {selected_verse['reference']} (Relevance: {selected_verse['relevance_score']}/10)")
         
         # Get specific application for the verse
         logger.info("Generating concise application summary...")
-        application_response = await client.chat.completions.create(
+        application_response = await chat_completion(
+            get_openai_client(),
+            "application",
             model="gpt-3.5-turbo",
             messages=[
                 {
@@ -524,64 +592,299 @@ async def get_verse_application(analysis: InputAnalysis) -> VerseApplication:
     except json.JSONDecodeError as e:
         logger.error(f"Error parsing AI response: {str(e)}")
         raise HTTPException(status_code=500, detail="Error processing AI response")
+    except LLMUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error generating verse application: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/get_verse")
-async def get_verse(request: QuestionRequest):
+@router.post("/api/get_verse")
+async def get_verse(request: QuestionRequest, http_request: Request):
     try:
         # Log the incoming request
         logger.info(f"Received question: {request.question}")
         
-        # Analyze the input
-        analysis = await analyze_input(request.question)
-        logger.info(f"Analysis completed: {analysis}")
-        
-        # Get verse application
-        result = await get_verse_application(analysis)
+        # Analyze the input and get verse application
+        result = await run_analysis(request.question, admission_key=client_key(http_request))
         logger.info(f"Verse application completed: {result}")
         
-        return {
+        return cached_json(http_request, {
             "verse": result.verse_text,
             "reference": result.verse,
             "relevance": result.relevance_rationale,
-            "explanation": result.application
-        }
+            "explanation": result.application,
+            "degraded": result.degraded
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/analyze", dependencies=[Depends(get_current_user)])
-async def analyze_text(request: TextRequest):
+def degraded_verse_application(text: str, analysis: Optional[InputAnalysis] = None) -> VerseApplication:
+    """Fast answer from the curated verse table for when OpenAI is unavailable."""
+    entry = find_fallback_verse(
+        themes=analysis.potential_themes if analysis else [],
+        keywords=analysis.keywords if analysis else [],
+        text=text
+    )
+    logger.warning(f"Serving degraded response for theme '{entry['theme']}'")
+    return VerseApplication(
+        verse=entry["reference"],
+        verse_text=entry["text"],
+        relevance_rationale=entry["relevance"],
+        application=entry["application"],
+        degraded=True
+    )
+
+async def run_analysis(text: str, use_cache: bool = True, admission_key: Optional[str] = None) -> VerseApplication:
+    """Answer from the cache, or generate one.
+
+    With `admission_key`, only generations that miss the cache go through
+    admission control, so cache hits cost no rate-limit tokens or slots.
+    Without one (jobs, precompute) generations are counted but never refused.
+    """
+    if use_cache:
+        cached = await asyncio.to_thread(get_response_cache().get, text)
+        if cached is not None:
+            logger.info("Serving cached verse application")
+            return VerseApplication(**cached)
+    
+    analysis = None
+    admission = get_admission().admit(admission_key) if admission_key else get_admission().track()
+    try:
+        async with admission:
+            analysis = await analyze_input(text)
+            logger.info("Successfully generated input analysis")
+            
+            verse_app = await get_verse_application(analysis)
+            logger.info("Successfully generated verse application")
+    except LLMUnavailableError as e:
+        logger.warning(f"OpenAI unavailable: {str(e)}")
+        return degraded_verse_application(text, analysis)
+    
+    if use_cache:
+        await asyncio.to_thread(get_response_cache().put, text, verse_app.dict())
+    return verse_app
+
+async def precompute_question(question: str) -> dict:
+    """Generate a fresh answer and store it in the response cache."""
+    verse_app = await run_analysis(question, use_cache=False)
+    if verse_app.degraded:
+        raise ValueError("OpenAI unavailable, not caching degraded response")
+    result = verse_app.dict()
+    await asyncio.to_thread(get_response_cache().put, question, result, "precompute")
+    return result
+
+@router.post("/api/analyze")
+async def analyze_text(request: TextRequest, http_request: Request, current_user: User = Depends(get_current_user)):
     try:
         logger.info(f"Received analysis request with text: {request.text[:100]}...")
         
         if not request.text.strip():
             raise HTTPException(status_code=400, detail="Text cannot be empty")
             
-        analysis = await analyze_input(request.text)
-        logger.info("Successfully generated input analysis")
-        
-        verse_app = await get_verse_application(analysis)
-        logger.info("Successfully generated verse application")
+        verse_app = await run_analysis(request.text, admission_key=f"user:{current_user.username}")
         
-        # Convert to JSON-safe format
-        response_data = jsonable_encoder(verse_app)
-        return JSONResponse(content=response_data)
+        # Serialize once
+        return cached_json(http_request, verse_app.dict())
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/")
-async def root():
-    return {"message": "Bible Verse API is running"}
+# Asynchronous jobs: submit with POST /jobs, then poll GET /jobs/{id}
+async def run_analysis_job(payload: dict) -> dict:
+    verse_app = await run_analysis(payload["text"])
+    return verse_app.dict()
+
+@router.post("/jobs", status_code=202)
+async def submit_job(
+    request: TextRequest,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+    # Scope idempotency keys per user so two clients can't collide
+    key = f"{current_user.username}:{idempotency_key}" if idempotency_key else None
+    try:
+        job = await asyncio.to_thread(get_job_queue().find, key, request.dict()) if key else None
+        created = False
+        if job is None:
+            # Only new jobs cost a rate-limit token; a retried key gets its job back
+            await get_admission().check_rate(f"user:{current_user.username}")
+            job, created = await asyncio.to_thread(
+                get_job_queue().submit, request.dict(), key, current_user.username
+            )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    logger.info(f"{'Queued' if created else 'Reused'} job {job['id']}")
+    if created and _job_pool is not None:
+        _job_pool.notify()
+    return DefaultResponse(
+        content=public_job(job),
+        status_code=202 if created else 200,
+        headers={"Location": f"/jobs/{job['id']}"}
+    )
 
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
+@router.get("/llm/metrics")
+async def get_llm_metrics():
+    metrics = llm_metrics()
+    metrics["admission"] = get_admission().snapshot()
+    return metrics
+
+@router.get("/jobs/metrics")
+async def job_metrics():
+    metrics = await asyncio.to_thread(_job_pool.metrics if _job_pool else get_job_queue().metrics)
+    metrics["response_cache"] = get_response_cache().metrics()
+    return metrics
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None or job["owner"] != current_user.username:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    # Finished jobs don't change until they expire
+    finished = job["finished_at"] is not None
+    return cached_json(request, public_job(job), "private, max-age=300" if finished else "no-cache")
+
+# Offline pack: the manifest lists content-addressed chunks, the client
+# downloads only the chunks whose hashes it doesn't already have.
+async def load_offline_pack(user: UserInDB, refresh: bool = False) -> OfflinePack:
+    if not user.id:
+        raise HTTPException(status_code=400, detail="User has no id")
+    packs = get_offline_packs()
+    pack = None if refresh else packs.get(user.id)
+    if pack is None:
+        pack = await asyncio.to_thread(build_pack, get_supabase(), user.id)
+        packs.put(pack)
+    return pack
+
+@router.get("/api/offline-pack")
+async def get_offline_pack(request: Request, current_user: UserInDB = Depends(get_current_user)):
+    try:
+        pack = await load_offline_pack(current_user)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error building offline pack: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to build offline pack")
+    
+    etag = f'"{pack.version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return DefaultResponse(content=pack.manifest, headers=headers)
+
+@router.get("/api/offline-pack/chunks/{chunk_hash}")
+async def get_offline_pack_chunk(chunk_hash: str, current_user: UserInDB = Depends(get_current_user)):
+    if not is_chunk_hash(chunk_hash):
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    pack = await load_offline_pack(current_user)
+    body = pack.chunks.get(chunk_hash)
+    if body is None and time.time() - pack.created_at >= OFFLINE_PACK_MIN_REFRESH_SECONDS:
+        # Another worker may have served a newer manifest; rebuild, but not on every miss
+        pack = await load_offline_pack(current_user, refresh=True)
+        body = pack.chunks.get(chunk_hash)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={
+            "Content-Encoding": "gzip",
+            "ETag": f'"{chunk_hash}"',
+            "Cache-Control": "private, max-age=31536000, immutable"
+        }
+    )
+
+# Payloads that never change are serialized once
+ROOT_RESPONSE = StaticJSON({"message": "Bible Verse API is running"})
+HEALTH_RESPONSE = StaticJSON({"status": "healthy"}, cache_control="no-cache")
+
+@router.get("/")
+async def root(request: Request):
+    return ROOT_RESPONSE.response(request)
+
+@router.get("/health")
+async def health_check(request: Request):
+    return HEALTH_RESPONSE.response(request)
+
+# Admin-only profiling; see profiling.py
+@router.get("/admin/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def profile(seconds: float = 10, all_threads: bool = False):
+    return await profile_window(seconds, all_threads)
+
+@router.get("/admin/profile/requests/{profile_id}", dependencies=[Depends(require_admin)])
+async def request_profile(profile_id: str):
+    profile = get_request_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@router.get("/admin/loop-lag", dependencies=[Depends(require_admin)])
+async def loop_lag():
+    if _loop_monitor is None:
+        raise HTTPException(status_code=404, detail="Loop lag monitor is disabled")
+    return _loop_monitor.snapshot()
+
+def preload() -> None:
+    """Import heavy dependencies and load read-only data.
+
+    Called from passenger_wsgi.py when PRELOAD_APP is set, so that with a
+    preforking server this happens once and forked workers share it.
+    """
+    import openai  # noqa: F401
+    import supabase  # noqa: F401
+    import jose.jwt  # noqa: F401
+    import passlib.context  # noqa: F401
+    get_response_cache().load()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _job_pool, _loop_monitor
+    check_openai_key()
+    if LOOP_LAG_MONITOR:
+        _loop_monitor = LoopLagMonitor()
+        _loop_monitor.start()
+    cache = get_response_cache()
+    if not cache.loaded:
+        await asyncio.to_thread(cache.load)
+    _job_pool = JobWorkerPool(get_job_queue(), run_analysis_job)
+    await _job_pool.start()
+    yield
+    await _job_pool.stop()
+    _job_pool = None
+    if _loop_monitor is not None:
+        await _loop_monitor.stop()
+        _loop_monitor = None
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan, default_response_class=DefaultResponse)
+    
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=Config.CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(router)
+    return app
+
+def __getattr__(name: str):
+    # Keep `uvicorn app:app` working without building the app at import time
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
+    uvicorn.run(create_app(), host=Config.HOST, port=Config.PORT, log_level="info")
@@ -1,18 +1,21 @@
-from supabase import create_client, Client
 from dotenv import load_dotenv
 import os
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
-supabase: Client = create_client(
-    supabase_url=os.getenv("SUPABASE_URL"),
-    supabase_key=os.getenv("SUPABASE_KEY")
-)
+# Supabase client, created on first use so importing this module stays cheap
+supabase = None
 
 def get_db():
+    global supabase
     try:
+        if supabase is None:
+            from supabase import create_client
+            supabase = create_client(
+                supabase_url=os.getenv("SUPABASE_URL"),
+                supabase_key=os.getenv("SUPABASE_KEY")
+            )
         return supabase
     except Exception as e:
         print(f"Error connecting to Supabase: {e}")
@@ -0,0 +1,75 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    orjson = None
+    DefaultResponse = JSONResponse
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+def revalidates(request: Request) -> bool:
+    # RFC 9110 only allows a 304 for GET and HEAD
+    return request.method in ("GET", "HEAD")
+
+
+def json_response(request: Request, body: bytes, etag: str, cache_control: str,
+                  status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serve pre-serialized JSON, or a 304 if a GET client already has this ETag."""
+    all_headers = {"ETag": etag, "Cache-Control": cache_control}
+    if headers:
+        all_headers.update(headers)
+    if status_code == 200 and revalidates(request) and not_modified(request, etag):
+        return Response(status_code=304, headers=all_headers)
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=all_headers)
+
+
+def cached_json(request: Request, content: Any, cache_control: str = "private, no-cache",
+                status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serialize once; GET responses get an ETag so repeat requests can be answered with 304.
+
+    Other methods (the POST generation endpoints) are served without an
+    ETag, since their answer is computed before any conditional check.
+    """
+    body = dumps(content)
+    if not revalidates(request):
+        return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+    return json_response(request, body, etag_for(body), cache_control, status_code, headers)
+
+
+class StaticJSON:
+    """A JSON payload serialized once, for endpoints whose answer never changes."""
+
+    def __init__(self, content: Any, cache_control: str = "public, max-age=300"):
+        self.body = dumps(content)
+        self.etag = etag_for(self.body)
+        self.cache_control = cache_control
+
+    def response(self, request: Request) -> Response:
+        return json_response(request, self.body, self.etag, self.cache_control)
@@ -0,0 +1,397 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Job queue configuration
+JOBS_DB_PATH = os.getenv(
+    "JOBS_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db")
+)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", 3600))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 120))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))
+JOB_DRAIN_SECONDS = float(os.getenv("JOB_DRAIN_SECONDS", 20))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_SCHEMA = """
+create table if not exists jobs (
+    id text primary key,
+    idempotency_key text unique,
+    owner text,
+    status text not null,
+    payload text not null,
+    payload_hash text,
+    result text,
+    error text,
+    attempts integer not null default 0,
+    created_at real not null,
+    started_at real,
+    finished_at real,
+    lease_expires_at real,
+    expires_at real
+);
+create index if not exists jobs_status_created_idx on jobs(status, created_at);
+create index if not exists jobs_expires_idx on jobs(expires_at);
+"""
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused with a different payload."""
+
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    """Durable job queue stored in a local SQLite file.
+
+    Every gunicorn worker opens the same file, so jobs submitted to one
+    worker can be claimed by any other. Claims take a lease; a job whose
+    worker died is handed out again once the lease runs out.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH, result_ttl: int = JOB_RESULT_TTL_SECONDS,
+                 lease_seconds: int = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.result_ttl = result_ttl
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._reader: Optional[sqlite3.Connection] = None
+        self._reader_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("pragma table_info(jobs)")}
+            if "payload_hash" not in columns:
+                conn.execute("alter table jobs add column payload_hash text")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("pragma journal_mode=wal")
+        conn.execute("pragma synchronous=normal")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, payload: Dict[str, Any], idempotency_key: Optional[str] = None,
+               owner: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Queue a job. Returns the job and whether it was newly created.
+
+        Resubmitting with an idempotency key that is still live returns the
+        existing job instead of queueing the work twice. Reusing the key for
+        a different payload raises IdempotencyConflict.
+        """
+        now = time.time()
+        digest = payload_hash(payload)
+        conn = self._connect()
+        try:
+            conn.execute("begin immediate")
+            if idempotency_key:
+                row = conn.execute(
+                    "select * from jobs where idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+                if row and (row["expires_at"] is None or row["expires_at"] > now):
+                    if row["payload_hash"] is not None and row["payload_hash"] != digest:
+                        raise IdempotencyConflict(idempotency_key)
+                    conn.execute("commit")
+                    return self._to_dict(row), False
+                if row:
+                    # The previous result has expired, so the key is free again
+                    conn.execute("delete from jobs where id = ?", (row["id"],))
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "insert into jobs (id, idempotency_key, owner, status, payload, payload_hash, created_at) "
+                "values (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, idempotency_key, owner, QUEUED, json.dumps(payload), digest, now)
+            )
+            row = conn.execute("select * from jobs where id = ?", (job_id,)).fetchone()
+            conn.execute("commit")
+            return self._to_dict(row), True
+        except Exception:
+            conn.execute("rollback")
+            raise
+        finally:
+            conn.close()
+
+    def find(self, idempotency_key: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The live job for `idempotency_key`, if any, without queueing anything.
+
+        Raises IdempotencyConflict if the key was used for a different payload.
+        """
+        with self._connection() as conn:
+            row = conn.execute(
+                "select * from jobs where idempotency_key = ?", (idempotency_key,)
+            ).fetchone()
+        if row is None or (row["expires_at"] is not None and row["expires_at"] <= time.time()):
+            return None
+        if row["payload_hash"] is not None and row["payload_hash"] != payload_hash(payload):
+            raise IdempotencyConflict(idempotency_key)
+        return self._to_dict(row)
+
+    def has_runnable(self, now: Optional[float] = None) -> bool:
+        """Cheap read-only check for work, so idle polls never take the write lock."""
+        now = time.time() if now is None else now
+        with self._reader_lock:
+            if self._reader is None:
+                self._reader = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                               check_same_thread=False)
+            row = self._reader.execute(
+                "select 1 from jobs where status = ? "
+                "or (status = ? and lease_expires_at < ?) limit 1",
+                (QUEUED, RUNNING, now)
+            ).fetchone()
+        return row is not None
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest runnable job, or None if the queue is empty."""
+        now = time.time()
+        if not self.has_runnable(now):
+            return None
+        conn = self._connect()
+        try:
+            conn.execute("begin immediate")
+            row = conn.execute(
+                "select * from jobs where status = ? "
+                "or (status = ? and lease_expires_at < ?) "
+                "order by created_at limit 1",
+                (QUEUED, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("commit")
+                return None
+            if row["attempts"] >= self.max_attempts:
+                conn.execute(
+                    "update jobs set status = ?, error = ?, finished_at = ?, expires_at = ? where id = ?",
+                    (FAILED, "Job exceeded maximum attempts", now, now + self.result_ttl, row["id"])
+                )
+                conn.execute("commit")
+                return None
+            conn.execute(
+                "update jobs set status = ?, attempts = attempts + 1, started_at = ?, "
+                "lease_expires_at = ? where id = ?",
+                (RUNNING, now, now + self.lease_seconds, row["id"])
+            )
+            row = conn.execute("select * from jobs where id = ?", (row["id"],)).fetchone()
+            conn.execute("commit")
+            return self._to_dict(row)
+        except Exception:
+            conn.execute("rollback")
+            raise
+        finally:
+            conn.close()
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        self._finish(job_id, SUCCEEDED, result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, FAILED, error=error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None,
+                error: Optional[str] = None) -> None:
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "update jobs set status = ?, result = ?, error = ?, finished_at = ?, "
+                "lease_expires_at = null, expires_at = ? where id = ?",
+                (status, result, error, now, now + self.result_ttl, job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connection() as conn:
+            row = conn.execute("select * from jobs where id = ?", (job_id,)).fetchone()
+        if row is None or (row["expires_at"] is not None and row["expires_at"] <= time.time()):
+            return None
+        return self._to_dict(row)
+
+    def purge_expired(self) -> int:
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "delete from jobs where expires_at is not null and expires_at <= ?", (time.time(),)
+            )
+            return cursor.rowcount
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._connection() as conn:
+            counts = dict(conn.execute(
+                "select status, count(*) from jobs group by status"
+            ).fetchall())
+            oldest = conn.execute(
+                "select min(created_at) from jobs where status = ?", (QUEUED,)
+            ).fetchone()[0]
+        return {
+            "queue_depth": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "succeeded": counts.get(SUCCEEDED, 0),
+            "failed": counts.get(FAILED, 0),
+            "oldest_queued_age_seconds": round(now - oldest, 3) if oldest else 0.0,
+        }
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = {
+            "id": row["id"],
+            "status": row["status"],
+            "owner": row["owner"],
+            "payload": json.loads(row["payload"]),
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "finished_at": row["finished_at"],
+        }
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of a job that are returned to API clients."""
+    data = {
+        "id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"],
+    }
+    if "result" in job:
+        data["result"] = job["result"]
+    if "error" in job:
+        data["error"] = job["error"]
+    return data
+
+
+class JobWorkerPool:
+    """Runs queued jobs through an async handler inside the current event loop.
+
+    A single poller per process claims jobs, and only while a worker is free,
+    then hands them to the worker tasks. Call notify() after a local submit to
+    skip the wait for the next poll.
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 concurrency: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._poller_task: Optional[asyncio.Task] = None
+        self._jobs: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self.busy = 0
+
+    async def start(self) -> None:
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._janitor()))
+        if self.concurrency > 0:
+            self._poller_task = asyncio.create_task(self._poller())
+        logger.info(f"Started {self.concurrency} job workers on {self.queue.path}")
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def stop(self, timeout: float = JOB_DRAIN_SECONDS) -> None:
+        """Stop claiming new jobs and give in-flight ones up to `timeout` seconds."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._poller_task:
+            # Unblock a poller waiting for a free worker; it sees _stopping and exits
+            self._slots.release()
+            await self._poller_task
+            self._poller_task = None
+        if not self._tasks:
+            return
+        for _ in range(self.concurrency):
+            self._jobs.put_nowait(None)
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _wait_for_work(self) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _poller(self) -> None:
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            job = None
+            while job is None and not self._stopping.is_set():
+                try:
+                    job = await asyncio.to_thread(self.queue.claim)
+                except Exception as e:
+                    logger.error(f"Job poller failed to claim a job: {str(e)}")
+                if job is None:
+                    await self._wait_for_work()
+            if job is None:
+                self._slots.release()
+                return
+            self._jobs.put_nowait(job)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._jobs.get()
+            if job is None:
+                return
+
+            self.busy += 1
+            try:
+                logger.info(f"Job worker {index} running job {job['id']}")
+                result = await self.handler(job["payload"])
+                await asyncio.to_thread(self.queue.complete, job["id"], result)
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {str(e)}")
+                await asyncio.to_thread(self.queue.fail, job["id"], str(e))
+            finally:
+                self.busy -= 1
+                self._slots.release()
+
+    async def _janitor(self) -> None:
+        interval = max(self.queue.result_ttl / 4, 5)
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                purged = await asyncio.to_thread(self.queue.purge_expired)
+                if purged:
+                    logger.info(f"Purged {purged} expired jobs")
+            except Exception as e:
+                logger.error(f"Failed to purge expired jobs: {str(e)}")
+
+    def metrics(self) -> Dict[str, Any]:
+        data = self.queue.metrics()
+        data["workers"] = self.concurrency
+        data["workers_busy"] = self.busy
+        return data
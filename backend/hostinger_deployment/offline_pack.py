@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Offline pack configuration
+OFFLINE_PACK_FORMAT = 1
+OFFLINE_PACK_MAX_CHATS = int(os.getenv("OFFLINE_PACK_MAX_CHATS", 200))
+OFFLINE_PACK_TTL_SECONDS = int(os.getenv("OFFLINE_PACK_TTL_SECONDS", 60))
+# A chunk that isn't in the cached pack triggers a rebuild at most this often
+OFFLINE_PACK_MIN_REFRESH_SECONDS = int(os.getenv("OFFLINE_PACK_MIN_REFRESH_SECONDS", 10))
+OFFLINE_PACK_CACHE_USERS = int(os.getenv("OFFLINE_PACK_CACHE_USERS", 500))
+# Verse texts are spread over this many chunks so a new reference only changes one
+TEXT_BUCKETS = 16
+
+_CHUNK_HASH_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def is_chunk_hash(value: str) -> bool:
+    return _CHUNK_HASH_RE.fullmatch(value) is not None
+
+
+def _encode(payload: Any) -> Tuple[str, bytes]:
+    """Canonical JSON for a chunk, returning (content hash, gzipped bytes)."""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    # mtime=0 keeps the compressed bytes identical for identical content
+    return hashlib.sha256(raw).hexdigest(), gzip.compress(raw, compresslevel=9, mtime=0)
+
+
+def _month(row: Dict[str, Any]) -> str:
+    return (row.get("created_at") or "undated")[:7]
+
+
+def _group_by_month(rows: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(_month(row), []).append(row)
+    return groups
+
+
+def _text_bucket(reference: str) -> int:
+    return int(hashlib.sha256(reference.encode("utf-8")).hexdigest(), 16) % TEXT_BUCKETS
+
+
+class OfflinePack:
+    """A user's offline data split into content-addressed, gzipped chunks.
+
+    Saved verses and chats are chunked by month, so adding to them only
+    changes the current month's chunk; the client keeps every chunk whose
+    hash it already has and downloads the rest.
+    """
+
+    def __init__(self, user_id: str, chunks: List[Tuple[str, str, int, bytes]]):
+        self.user_id = user_id
+        self.created_at = time.time()
+        self.chunks: Dict[str, bytes] = {}
+        entries = []
+        for name, digest, items, body in sorted(chunks):
+            self.chunks[digest] = body
+            entries.append({"name": name, "hash": digest, "items": items, "size": len(body)})
+        self.version = hashlib.sha256(
+            "".join(f"{e['name']}:{e['hash']};" for e in entries).encode("utf-8")
+        ).hexdigest()
+        self.manifest = {
+            "format": OFFLINE_PACK_FORMAT,
+            "version": self.version,
+            "generated_at": int(self.created_at),
+            "chunks": entries,
+        }
+
+
+def build_pack(db, user_id: str, chat_owner_id: Optional[str] = None) -> OfflinePack:
+    """Query Supabase for the user's saved verses and recent chats and chunk them.
+
+    Verses are stored under the backend user id, chats under the Supabase
+    Auth id. Chats are only included for a verified `chat_owner_id`; an
+    email match is not proof that both accounts belong to the same person.
+    """
+    verses = db.table('verses').select('*').eq('user_id', user_id).execute().data or []
+    chats = []
+    if chat_owner_id:
+        chats = db.table('chats').select('id,question,response,created_at,is_archived').eq(
+            'user_id', chat_owner_id
+        ).order('created_at', desc=True).limit(OFFLINE_PACK_MAX_CHATS).execute().data or []
+
+    # Oldest first so existing entries keep their position within a month
+    verses.sort(key=lambda row: (row.get("created_at") or "", str(row.get("id"))))
+    chats.sort(key=lambda row: (row.get("created_at") or "", str(row.get("id"))))
+
+    texts: Dict[str, str] = {}
+    for row in verses:
+        if row.get("reference") and row.get("verse_text"):
+            texts[row["reference"]] = row["verse_text"]
+    for row in chats:
+        response = row.get("response") or {}
+        if isinstance(response, dict) and response.get("reference") and response.get("verse"):
+            texts.setdefault(response["reference"], response["verse"])
+
+    chunks = []
+    for kind, rows in (("verses", verses), ("chats", chats)):
+        for month, group in _group_by_month(rows).items():
+            digest, body = _encode(group)
+            chunks.append((f"{kind}/{month}", digest, len(group), body))
+
+    buckets: Dict[int, Dict[str, str]] = {}
+    for reference, text in texts.items():
+        buckets.setdefault(_text_bucket(reference), {})[reference] = text
+    for bucket, group in buckets.items():
+        digest, body = _encode(group)
+        chunks.append((f"texts/{bucket:02d}", digest, len(group), body))
+
+    return OfflinePack(user_id, chunks)
+
+
+class OfflinePackStore:
+    """Recently built packs per user, so chunk downloads don't re-query Supabase."""
+
+    def __init__(self, ttl: int = OFFLINE_PACK_TTL_SECONDS, max_users: int = OFFLINE_PACK_CACHE_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._packs: "OrderedDict[str, OfflinePack]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[OfflinePack]:
+        pack = self._packs.get(user_id)
+        if pack is None or pack.created_at + self.ttl <= time.time():
+            return None
+        self._packs.move_to_end(user_id)
+        return pack
+
+    def put(self, pack: OfflinePack) -> None:
+        self._packs[pack.user_id] = pack
+        self._packs.move_to_end(pack.user_id)
+        while len(self._packs) > self.max_users:
+            self._packs.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        self._packs.pop(user_id, None)
@@ -1,4 +1,8 @@
-from app import app as application
+import os
+from app import create_app, preload
+
+if os.getenv("PRELOAD_APP", "false").lower() in ("1", "true", "yes"):
+    preload()
 
 # This is required for Hostinger's Python hosting
-application = application
+application = create_app()
@@ -0,0 +1,100 @@
+"""Precompute answers for popular questions and store them in the response cache.
+
+Usage:
+    python precompute.py --corpus precompute_questions.txt
+    python precompute.py --top-chats 200 --concurrency 8
+
+Questions already answered (recorded in the checkpoint file) are skipped,
+so an interrupted run can simply be started again. Workers load the
+results into memory when they start.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from collections import Counter
+from typing import List, Set
+
+logger = logging.getLogger("precompute")
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "precompute.checkpoint")
+
+
+def read_corpus(path: str) -> List[str]:
+    """One question per line; blank lines and lines starting with # are ignored."""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def top_chat_questions(limit: int, scan: int = 10000) -> List[str]:
+    """The most frequently asked questions in public.chats."""
+    from database import get_db
+
+    response = get_db().table("chats").select("question").order(
+        "created_at", desc=True
+    ).limit(scan).execute()
+    counts = Counter(" ".join(row["question"].split()) for row in response.data if row.get("question"))
+    return [question for question, _ in counts.most_common(limit)]
+
+
+def read_checkpoint(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {json.loads(line)["question"] for line in f if line.strip()}
+
+
+async def run(questions: List[str], concurrency: int, checkpoint: str, refresh: bool) -> None:
+    from app import precompute_question
+
+    done = set() if refresh else read_checkpoint(checkpoint)
+    todo = [q for q in dict.fromkeys(questions) if q not in done]
+    logger.info(f"{len(todo)} questions to precompute ({len(done)} already done)")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    lock = asyncio.Lock()
+    failures = 0
+
+    async def process(question: str) -> None:
+        nonlocal failures
+        async with semaphore:
+            try:
+                await precompute_question(question)
+            except Exception as e:
+                failures += 1
+                logger.error(f"Failed to precompute '{question[:60]}': {str(e)}")
+                return
+        async with lock:
+            with open(checkpoint, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"question": question}) + "\n")
+        logger.info(f"Precomputed '{question[:60]}'")
+
+    await asyncio.gather(*(process(q) for q in todo))
+    logger.info(f"Finished: {len(todo) - failures} stored, {failures} failed")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompute answers into the response cache")
+    parser.add_argument("--corpus", action="append", default=[], help="File with one question per line")
+    parser.add_argument("--top-chats", type=int, default=0, help="Also include the N most asked questions from public.chats")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions generated at once")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="File recording finished questions")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the checkpoint and regenerate everything")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    questions: List[str] = []
+    for path in args.corpus:
+        questions.extend(read_corpus(path))
+    if args.top_chats:
+        questions.extend(top_chat_questions(args.top_chats))
+    if not questions:
+        parser.error("no questions given; use --corpus and/or --top-chats")
+
+    asyncio.run(run(questions, args.concurrency, args.checkpoint, args.refresh))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Response cache configuration
+RESPONSE_CACHE_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "response_cache.db")
+)
+RESPONSE_CACHE_MAX_ITEMS = int(os.getenv("RESPONSE_CACHE_MAX_ITEMS", 5000))
+# Answers (and the questions they were asked for) are kept for 30 days by default; 0 keeps them forever
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+RESPONSE_CACHE_MAX_ROWS = int(os.getenv("RESPONSE_CACHE_MAX_ROWS", 50000))
+# Expired and excess rows are purged at load and after this many writes
+RESPONSE_CACHE_PURGE_EVERY = 100
+
+_SCHEMA = """
+create table if not exists responses (
+    key text primary key,
+    question text not null,
+    response text not null,
+    source text not null,
+    created_at real not null
+);
+"""
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def cache_key(question: str) -> str:
+    """Key questions so trivial differences in case and spacing share an answer."""
+    normalized = _SPACE_RE.sub(" ", question.strip().lower()).rstrip("?.! ")
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Generated answers keyed by question, backed by a local SQLite file.
+
+    Workers load the whole store into memory at startup so precomputed
+    answers are served without touching disk; new answers are written
+    through to SQLite so other workers and restarts pick them up. The
+    file is capped at max_rows, evicting live answers before precomputed
+    ones, oldest first.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_items: int = RESPONSE_CACHE_MAX_ITEMS,
+                 ttl: int = RESPONSE_CACHE_TTL_SECONDS, max_rows: int = RESPONSE_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._writes = 0
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # get and put run concurrently in asyncio.to_thread workers
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loaded = False
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("pragma journal_mode=wal")
+            yield conn
+        finally:
+            conn.close()
+
+    def _expired(self, created_at: float) -> bool:
+        return bool(self.ttl) and created_at + self.ttl <= time.time()
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def purge(self) -> int:
+        """Delete expired rows and trim the file to max_rows. Returns how many were deleted."""
+        with self._connection() as conn:
+            deleted = 0
+            if self.ttl:
+                deleted += conn.execute(
+                    "delete from responses where created_at <= ?", (time.time() - self.ttl,)
+                ).rowcount
+            excess = conn.execute("select count(*) from responses").fetchone()[0] - self.max_rows
+            if excess > 0:
+                deleted += conn.execute(
+                    "delete from responses where key in (select key from responses "
+                    "order by source = 'precompute', created_at limit ?)", (excess,)
+                ).rowcount
+        if deleted:
+            logger.info(f"Purged {deleted} cached responses from {self.path}")
+        return deleted
+
+    def load(self) -> int:
+        """Load stored answers into memory, newest last. Returns how many were loaded."""
+        self.purge()
+        with self._connection() as conn:
+            rows = conn.execute(
+                "select key, response, created_at from responses order by created_at desc limit ?",
+                (self.max_items,)
+            ).fetchall()
+        for key, response, created_at in reversed(rows):
+            if not self._expired(created_at):
+                self._remember(key, {"response": json.loads(response), "created_at": created_at})
+        self.loaded = True
+        logger.info(f"Loaded {len(self._memory)} cached responses from {self.path}")
+        return len(self._memory)
+
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        key = cache_key(question)
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is None:
+            # Another worker may have stored it since we loaded
+            with self._connection() as conn:
+                row = conn.execute(
+                    "select response, created_at from responses where key = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                entry = {"response": json.loads(row[0]), "created_at": row[1]}
+                self._remember(key, entry)
+        with self._lock:
+            if entry is None or self._expired(entry["created_at"]):
+                self.misses += 1
+                return None
+            self.hits += 1
+            # A concurrent put may have evicted it since it was read
+            if key in self._memory:
+                self._memory.move_to_end(key)
+        return entry["response"]
+
+    def put(self, question: str, response: Dict[str, Any], source: str = "live") -> None:
+        key = cache_key(question)
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "insert or replace into responses (key, question, response, source, created_at) "
+                "values (?, ?, ?, ?, ?)",
+                (key, question, json.dumps(response), source, now)
+            )
+        self._remember(key, {"response": response, "created_at": now})
+        self._writes += 1
+        if self._writes % RESPONSE_CACHE_PURGE_EVERY == 0:
+            self.purge()
+
+    def contains(self, question: str) -> bool:
+        with self._connection() as conn:
+            row = conn.execute(
+                "select created_at from responses where key = ?", (cache_key(question),)
+            ).fetchone()
+        return row is not None and not self._expired(row[0])
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"items_in_memory": len(self._memory), "hits": self.hits, "misses": self.misses}
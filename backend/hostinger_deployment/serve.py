@@ -0,0 +1,174 @@
+"""Production launcher for the backend.
+
+    python serve.py
+
+Runs the app under gunicorn with uvicorn workers, sized for the CPUs this
+process may actually use. LLM calls are I/O bound, so each worker's event
+loop can keep many requests in flight; one worker per core plus one leaves
+headroom for the blocking Supabase and bcrypt calls. uvloop and httptools
+are used when installed. On SIGTERM workers stop accepting connections and
+let in-flight requests finish before exiting. Workers are recycled after
+MAX_REQUESTS (plus jitter) to bound memory growth.
+
+Everything can be overridden with environment variables; WEB_CONCURRENCY
+sets the worker count directly. Where gunicorn isn't available (Windows),
+it falls back to uvicorn's own process manager with the same settings.
+"""
+import logging
+import math
+import os
+import sys
+
+logger = logging.getLogger("serve")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8080))
+APP_MODULE = os.getenv(
+    "APP_MODULE",
+    "wsgi:app" if os.path.exists(os.path.join(HERE, "wsgi.py")) else "passenger_wsgi:application"
+)
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", 8))
+KEEPALIVE = int(os.getenv("KEEPALIVE", 5))
+BACKLOG = int(os.getenv("BACKLOG", 2048))
+# Long enough for the whole multi-call LLM pipeline
+TIMEOUT = int(os.getenv("TIMEOUT", 120))
+# Must stay below the platform's stop timeout or workers are killed mid-drain
+# (Heroku allows 30s, so the Procfile lowers this; Docker needs --stop-timeout)
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 90))
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", 2000))
+MAX_REQUESTS_JITTER = int(os.getenv("MAX_REQUESTS_JITTER", 200))
+PRELOAD_APP = os.getenv("PRELOAD_APP", "false").lower() in ("1", "true", "yes")
+JOB_DRAIN_SECONDS = float(os.getenv("JOB_DRAIN_SECONDS", 20))
+
+
+def available_cpus() -> int:
+    """CPUs this process can use, respecting affinity and cgroup (container) quotas."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def worker_count() -> int:
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.getenv("WEB_CONCURRENCY")))
+    return max(2, min(available_cpus() + 1, MAX_WORKERS))
+
+
+def request_drain_seconds() -> int:
+    # Leave time after requests drain for the job pool to stop before gunicorn kills the worker
+    return max(1, int(GRACEFUL_TIMEOUT - JOB_DRAIN_SECONDS - 5))
+
+
+def event_loop() -> str:
+    try:
+        import uvloop  # noqa: F401
+        return "uvloop"
+    except ImportError:
+        return "asyncio"
+
+
+def http_protocol() -> str:
+    try:
+        import httptools  # noqa: F401
+        return "httptools"
+    except ImportError:
+        return "h11"
+
+
+try:
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+except ImportError:
+    BaseApplication = UvicornWorker = None
+
+Launcher = None
+
+
+if UvicornWorker is not None:
+
+    class TunedUvicornWorker(UvicornWorker):
+        # Client addresses are taken from X-Forwarded-For by admission.client_address,
+        # which unlike uvicorn's proxy headers ignores entries the client wrote itself
+        CONFIG_KWARGS = {"loop": event_loop(), "http": http_protocol(), "lifespan": "on",
+                         "proxy_headers": False}
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # Without this uvicorn waits on open connections until gunicorn kills it
+            self.config.timeout_graceful_shutdown = request_drain_seconds()
+
+    class Launcher(BaseApplication):
+        def __init__(self, app_module: str, options: dict):
+            self.app_module = app_module
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from gunicorn.util import import_app
+            return import_app(self.app_module)
+
+
+def gunicorn_options() -> dict:
+    return {
+        "bind": f"{HOST}:{PORT}",
+        "workers": worker_count(),
+        "worker_class": "serve.TunedUvicornWorker",
+        "keepalive": KEEPALIVE,
+        "backlog": BACKLOG,
+        "timeout": TIMEOUT,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS_JITTER,
+        "preload_app": PRELOAD_APP,
+        "chdir": HERE,
+        "accesslog": "-",
+    }
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    os.environ.setdefault("JOB_DRAIN_SECONDS", str(JOB_DRAIN_SECONDS))
+    sys.path.insert(0, HERE)
+    workers = worker_count()
+    logger.info(
+        f"Serving {APP_MODULE} on {HOST}:{PORT} with {workers} workers "
+        f"({available_cpus()} CPUs, loop={event_loop()}, http={http_protocol()})"
+    )
+
+    if Launcher is not None:
+        Launcher(APP_MODULE, gunicorn_options()).run()
+        return
+
+    import uvicorn
+    uvicorn.run(
+        APP_MODULE,
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop=event_loop(),
+        http=http_protocol(),
+        backlog=BACKLOG,
+        timeout_keep_alive=KEEPALIVE,
+        timeout_graceful_shutdown=request_drain_seconds(),
+        proxy_headers=False,
+        app_dir=HERE,
+    )
+
+
+if __name__ == "__main__":
+    main()
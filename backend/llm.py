@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker configuration
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 15))
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", 60))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 5))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", 8))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", 0.5))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 30))
+
+# Request hedging configuration (opt-in)
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", 0.1))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", 0.5))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMUnavailableError(Exception):
+    """The model could not answer in time; callers should serve a degraded answer."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised without calling OpenAI while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Tracks OpenAI latency and errors over a sliding window.
+
+    The circuit opens when either the error rate or the slow-call rate in the
+    window crosses its threshold. After `open_seconds` a single probe call is
+    let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, window_seconds: float = BREAKER_WINDOW_SECONDS, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 slow_rate: float = BREAKER_SLOW_RATE, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        # (finished_at, succeeded, latency)
+        self._calls: Deque[Tuple[float, bool, float]] = deque()
+
+    def before_call(self) -> None:
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self.opened_at < self.open_seconds:
+                raise CircuitOpenError("OpenAI circuit is open")
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError("OpenAI circuit is half-open and a probe is in flight")
+            self._probe_in_flight = True
+
+    def record(self, succeeded: bool, latency: float) -> None:
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if succeeded and latency < self.slow_call_seconds:
+                self._calls.clear()
+                self._transition(CLOSED)
+            else:
+                self._open(now)
+            return
+
+        self._calls.append((now, succeeded, latency))
+        self._trim(now)
+        if self.state == CLOSED and len(self._calls) >= self.min_calls:
+            total = len(self._calls)
+            errors = sum(1 for _, ok, _ in self._calls if not ok)
+            slow = sum(1 for _, ok, lat in self._calls if ok and lat >= self.slow_call_seconds)
+            if errors / total >= self.error_rate or slow / total >= self.slow_rate:
+                self._open(now)
+
+    def abandon(self) -> None:
+        """Forget a call that was cancelled before it finished."""
+        self._probe_in_flight = False
+
+    def _trim(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _open(self, now: float) -> None:
+        self.opened_at = now
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"OpenAI circuit breaker {self.state} -> {state}")
+            self.state = state
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        total = len(self._calls)
+        errors = sum(1 for _, ok, _ in self._calls if not ok)
+        return {
+            "state": self.state,
+            "window_calls": total,
+            "window_error_rate": round(errors / total, 3) if total else 0.0,
+        }
+
+
+class StageStats:
+    """Recent latencies and hedging counters for one pipeline stage."""
+
+    def __init__(self, samples: int = 200):
+        self.latencies: Deque[float] = deque(maxlen=samples)
+        # Whether each of the recent calls fired a hedge, for the rate budget
+        self.recent_hedges: Deque[bool] = deque(maxlen=samples)
+        self.calls = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.hedges_skipped = 0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "calls": self.calls,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "hedges_skipped_budget": self.hedges_skipped,
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class Hedger:
+    """Sends a duplicate request when the first is slower than recent calls.
+
+    The hedge fires once a call has been outstanding longer than the
+    configured percentile of recent latency for its stage. Whichever request
+    returns first wins and the other is cancelled. At most `max_rate` of the
+    recent calls in a stage may hedge, so a provider-wide slowdown can't
+    double our traffic.
+    """
+
+    def __init__(self, enabled: bool = LLM_HEDGING, percentile: float = HEDGE_PERCENTILE,
+                 max_rate: float = HEDGE_MAX_RATE, min_samples: int = HEDGE_MIN_SAMPLES,
+                 min_delay: float = HEDGE_MIN_DELAY_SECONDS):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.stages: Dict[str, StageStats] = {}
+
+    def stats(self, stage: str) -> StageStats:
+        if stage not in self.stages:
+            self.stages[stage] = StageStats()
+        return self.stages[stage]
+
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        stats = self.stats(stage)
+        if not self.enabled or len(stats.latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, stats.percentile(self.percentile))
+
+    def _within_budget(self, stats: StageStats) -> bool:
+        if not stats.recent_hedges:
+            return True
+        return sum(stats.recent_hedges) / len(stats.recent_hedges) < self.max_rate
+
+    async def create(self, client, stage: str, kwargs: Dict[str, Any]):
+        stats = self.stats(stage)
+        stats.calls += 1
+        started = time.monotonic()
+        primary = asyncio.ensure_future(client.chat.completions.create(**kwargs))
+        tasks = {primary}
+        hedged = False
+        try:
+            delay = self.hedge_delay(stage)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    if self._within_budget(stats):
+                        hedged = True
+                        stats.hedges_fired += 1
+                        logger.info(f"Hedging {stage} call after {delay:.2f}s")
+                        backup = asyncio.ensure_future(client.chat.completions.create(**kwargs))
+                        tasks.add(backup)
+                    else:
+                        stats.hedges_skipped += 1
+
+            winner = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer a successful response; only fail if every request failed
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    winner = winner or task
+                if winner is not None and winner.exception() is None:
+                    break
+
+            if hedged and winner is not primary and winner.exception() is None:
+                stats.hedges_won += 1
+            response = winner.result()
+            stats.latencies.append(time.monotonic() - started)
+            return response
+        finally:
+            stats.recent_hedges.append(hedged)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "stages": {stage: stats.snapshot() for stage, stats in self.stages.items()},
+        }
+
+
+breaker = CircuitBreaker()
+hedger = Hedger()
+
+
+def is_provider_error(error: Exception) -> bool:
+    """Connection failures, rate limits and 5xx responses: OpenAI, not the request, is at fault."""
+    # openai is imported lazily to keep worker startup fast; by now the client has loaded it
+    import openai
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def llm_metrics() -> Dict[str, Any]:
+    return {"breaker": breaker.snapshot(), "hedging": hedger.snapshot()}
+
+
+async def chat_completion(client, stage: str, **kwargs):
+    """Call `client.chat.completions.create` through the circuit breaker.
+
+    `stage` names the pipeline step for logging and metrics. Calls are cut
+    off after LLM_TIMEOUT_SECONDS so a slow provider can't hold a request
+    open, and are hedged when LLM_HEDGING is enabled. Timeouts and provider
+    errors are raised as LLMUnavailableError so callers can degrade; only
+    those count against the breaker.
+    """
+    breaker.before_call()
+    started = time.monotonic()
+    try:
+        response = await asyncio.wait_for(
+            hedger.create(client, stage, kwargs), timeout=LLM_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        breaker.record(False, time.monotonic() - started)
+        logger.error(f"OpenAI call for {stage} timed out after {LLM_TIMEOUT_SECONDS}s")
+        raise LLMUnavailableError(f"OpenAI call for {stage} timed out")
+    except asyncio.CancelledError:
+        # Don't leave a half-open probe stuck if the request was abandoned
+        breaker.abandon()
+        raise
+    except Exception as e:
+        if is_provider_error(e):
+            breaker.record(False, time.monotonic() - started)
+            logger.error(f"OpenAI call for {stage} failed: {str(e)}")
+            raise LLMUnavailableError(f"OpenAI call for {stage} failed: {str(e)}") from e
+        # A rejected request (e.g. too long) says nothing about OpenAI's health
+        breaker.abandon()
+        raise
+    breaker.record(True, time.monotonic() - started)
+    return response
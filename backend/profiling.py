@@ -0,0 +1,222 @@
+"""Admin-only profiling hooks.
+
+Stacks are reported in the collapsed "frame;frame;frame count" format read
+by flamegraph.pl, speedscope and inferno. All endpoints require the
+X-Admin-Token header to match ADMIN_TOKEN, and are disabled if it isn't set.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, deque
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+from fastapi import Header, HTTPException
+
+logger = logging.getLogger(__name__)
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+LOOP_LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "true").lower() in ("1", "true", "yes")
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", 250))
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", 50))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _collapse(frame, root: Optional[str] = None) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    if root:
+        names.append(root)
+    return ";".join(reversed(names))
+
+
+def collapsed(counts: Counter) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+class StackSampler:
+    """Samples thread stacks from a background thread at a fixed interval."""
+
+    def __init__(self, thread_ids: Optional[Iterable[int]] = None, interval: float = PROFILE_SAMPLE_INTERVAL):
+        # None samples every thread except the sampler itself
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                root = names.get(ident, str(ident)) if self.thread_ids is None else None
+                self.counts[_collapse(frame, root)] += 1
+            self.samples += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+
+_window_lock = asyncio.Lock()
+
+
+async def profile_window(seconds: float, all_threads: bool = False) -> str:
+    """Sample for `seconds` and return collapsed stacks. One window runs at a time."""
+    seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+    if _window_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with _window_lock:
+        sampler = StackSampler(None if all_threads else [threading.get_ident()]).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            counts = sampler.stop()
+    logger.info(f"Profiled {seconds}s: {sampler.samples} samples")
+    return collapsed(counts)
+
+
+# Per-request profiles, fetched afterwards by id
+recent_profiles: Deque[Tuple[str, Dict[str, object]]] = deque(maxlen=20)
+
+
+def get_request_profile(profile_id: str) -> Optional[Dict[str, object]]:
+    for pid, profile in recent_profiles:
+        if pid == profile_id:
+            return profile
+    return None
+
+
+class ProfilingMiddleware:
+    """Profiles a single request when it carries X-Profile: 1 and a valid admin token.
+
+    The event loop thread is sampled while the request runs, so other
+    requests served concurrently show up too; profile on a quiet worker
+    for the clearest picture. The profile id is returned in X-Profile-Id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMIN_TOKEN:
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        token = headers.get(b"x-admin-token", b"").decode("latin-1")
+        if headers.get(b"x-profile") != b"1" or not secrets.compare_digest(token, ADMIN_TOKEN):
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        started = time.monotonic()
+        sampler = StackSampler([threading.get_ident()]).start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            counts = sampler.stop()
+            recent_profiles.append((profile_id, {
+                "path": scope.get("path"),
+                "duration_seconds": round(time.monotonic() - started, 4),
+                "samples": sampler.samples,
+                "stacks": collapsed(counts),
+            }))
+
+
+class LoopLagMonitor:
+    """Logs the event loop's stack whenever something blocks it too long.
+
+    A coroutine on the loop records a heartbeat every interval; a watchdog
+    thread notices when the heartbeat goes stale past the threshold and logs
+    what the loop thread is executing at that moment, which is the
+    synchronous call holding up every other request.
+    """
+
+    def __init__(self, threshold_ms: float = LOOP_LAG_THRESHOLD_MS, interval_ms: float = LOOP_LAG_INTERVAL_MS):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.loop_thread: Optional[int] = None
+        self.last_beat = time.monotonic()
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.max_lag = max(self.max_lag, now - expected)
+            self.last_beat = now
+
+    def _watch(self) -> None:
+        reported = 0.0
+        while not self._stop.wait(self.interval):
+            beat = self.last_beat
+            lag = time.monotonic() - beat
+            if lag < self.threshold or beat == reported:
+                continue
+            # Report each stall once, at the moment it crosses the threshold
+            reported = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self.loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>"
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms, loop thread stack:\n{stack}")
+
+    def start(self) -> None:
+        self.loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._watchdog:
+            self._watchdog.join()
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "stalls": self.stalls,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+        }
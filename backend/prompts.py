@@ -0,0 +1,170 @@
+"""Versioned prompt templates and the compact analysis passed between stages.
+
+The analyze stage turns a question into a small `Analysis` (theme IDs, a
+sentiment, a short context line) instead of free-form prose, so the verse
+prompt stays short and stable. Each template keeps its fixed instructions in
+the system message and puts only per-request data in the user message.
+
+Bump a template's version whenever its text changes; check_prompt_tokens.py
+fails if a template grows past its token budget. Tokens are estimated at
+four characters each so the check gives the same answer everywhere.
+"""
+import json
+import logging
+import math
+import re
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+from fallback_verses import THEME_VERSES, match_theme
+
+logger = logging.getLogger(__name__)
+
+# Theme IDs are the curated fallback themes, so degraded answers can use them too
+THEME_IDS = tuple(THEME_VERSES)
+SENTIMENTS = ("distressed", "sad", "anxious", "angry", "neutral", "hopeful", "grateful", "curious")
+MAX_THEMES = 3
+MAX_REFS = 2
+CONTEXT_MAX_CHARS = 160
+# Output budget for the analysis; the IR is a few dozen tokens
+ANALYZE_MAX_TOKENS = 120
+
+
+class Analysis(BaseModel):
+    themes: List[str]
+    sentiment: str
+    context: str
+    refs: List[str] = []
+
+    def encode(self) -> str:
+        """Compact form used in the verse prompt."""
+        lines = [
+            f"themes: {','.join(self.themes)}",
+            f"sentiment: {self.sentiment}",
+            f"context: {self.context}",
+        ]
+        if self.refs:
+            lines.append(f"refs: {'; '.join(self.refs)}")
+        return "\n".join(lines)
+
+
+def _clip(text: str, limit: int) -> str:
+    text = re.sub(r"\s+", " ", text or "").strip()
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _as_list(value) -> list:
+    # A bare string would otherwise be iterated character by character
+    return value if isinstance(value, list) else []
+
+
+def parse_analysis(content: str, text: str) -> Analysis:
+    """Validate the analyze stage's JSON and clamp it to the IR budget.
+
+    Unknown themes and sentiments are dropped rather than failing the
+    request; if nothing usable is left, themes come from keyword matching
+    on the original text.
+    """
+    try:
+        data = json.loads(content)
+        if not isinstance(data, dict):
+            raise ValueError("analysis is not an object")
+    except ValueError as e:
+        logger.warning(f"Unparseable analysis, falling back to keyword match: {str(e)}")
+        data = {}
+
+    themes = []
+    for theme in _as_list(data.get("themes")):
+        theme = str(theme).strip().lower()
+        if theme in THEME_IDS and theme not in themes:
+            themes.append(theme)
+    if not themes:
+        themes = [match_theme(text=text)]
+
+    sentiment = str(data.get("sentiment") or "").strip().lower()
+    if sentiment not in SENTIMENTS:
+        sentiment = "neutral"
+
+    refs = [_clip(str(ref), 40) for ref in _as_list(data.get("refs")) if ref][:MAX_REFS]
+
+    return Analysis(
+        themes=themes[:MAX_THEMES],
+        sentiment=sentiment,
+        context=_clip(str(data.get("context") or text), CONTEXT_MAX_CHARS),
+        refs=refs,
+    )
+
+
+class PromptTemplate:
+    """A versioned prompt: a fixed system prefix plus a per-request user message."""
+
+    def __init__(self, name: str, version: int, system: str, user: str,
+                 max_prompt_tokens: int, sample: Dict[str, str]):
+        self.name = name
+        self.version = version
+        self.system = system
+        self.user = user
+        # Budget for the rendered sample, enforced by check_prompt_tokens.py
+        self.max_prompt_tokens = max_prompt_tokens
+        self.sample = sample
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def messages(self, **fields: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(**fields)},
+        ]
+
+
+ANALYZE = PromptTemplate(
+    name="analyze",
+    version=1,
+    system=(
+        "Classify the user's message for a Bible verse recommender. Reply with JSON only: "
+        '{"themes":[...],"sentiment":"...","context":"...","refs":[...]}\n'
+        f"themes: 1-{MAX_THEMES} IDs, most relevant first, from: {', '.join(THEME_IDS)}\n"
+        f"sentiment: one of {', '.join(SENTIMENTS)}\n"
+        f"context: the situation in under 25 words\n"
+        f"refs: Bible books or verses the user mentions, else []"
+    ),
+    user="{text}",
+    max_prompt_tokens=190,
+    sample={"text": "I just lost my job and I'm worried about paying the bills. How do I trust God with this?"},
+)
+
+VERSE = PromptTemplate(
+    name="verse",
+    version=1,
+    system=(
+        "You recommend one Bible verse and explain how it applies, based on a short analysis "
+        "of the user's situation. Reply with JSON only, in this exact format:\n"
+        '{"verse":"The Bible verse text","reference":"Book Chapter:Verse",'
+        '"relevance":"Why this verse is relevant","explanation":"Practical application and guidance"}\n'
+        "Quote the verse accurately, give its exact reference, say why it fits the situation "
+        "and give practical guidance based on it."
+    ),
+    user="{analysis}",
+    max_prompt_tokens=180,
+    sample={"analysis": Analysis(
+        themes=["provision", "anxiety", "faith"],
+        sentiment="anxious",
+        context="Lost their job and is worried about paying bills; wants to trust God with finances.",
+        refs=[],
+    ).encode()},
+)
+
+TEMPLATES = (ANALYZE, VERSE)
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count, about 4 characters per token for English text."""
+    return math.ceil(len(text) / 4)
+
+
+def prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    # Chat formatting adds about 4 tokens per message and 3 for the reply
+    return sum(count_tokens(m["content"]) + 4 for m in messages) + 3
@@ -1,7 +1,14 @@
-from app import app
+import os
+from app import create_app, preload
+
+# With gunicorn --preload this module is imported once in the master, so
+# read-only data loaded here is shared by every forked worker.
+if os.getenv("PRELOAD_APP", "false").lower() in ("1", "true", "yes"):
+    preload()
 
 # This is needed for gunicorn
-app = app
+app = create_app()
 
 if __name__ == "__main__":
-    app.run()
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")